@@ -0,0 +1,172 @@
+import csv
+import json
+import logging
+import sys
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+
+import two_frequencies
+import rates
+import secrecy_rate
+import optimal_frequency_distance
+import conditions_positive_zosc
+from disk_cache import enable_disk_cache
+from profiling import (enable_profiling, is_profiling_enabled, format_summary,
+                       dump_trace)
+
+
+LOGGER = logging.getLogger(__name__)
+
+COMMANDS = {
+        "two_frequencies": two_frequencies.main,
+        "rates": rates.main,
+        "secrecy_rate": secrecy_rate.main,
+        "optimal_frequency_distance": optimal_frequency_distance.main_optimal_frequency_distance,
+        "conditions_positive_zosc": conditions_positive_zosc.main,
+        }
+
+
+def _to_json(value):
+    # NaN and inf (e.g., rates without a positive ZOSC) are not valid JSON and
+    # are written as null
+    if isinstance(value, dict):
+        return {k: _to_json(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_to_json(v) for v in value]
+    if isinstance(value, (np.ndarray, np.generic)):
+        return _to_json(value.tolist())
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+def _parse_value(value: str):
+    try:
+        return float(value)
+    except ValueError:
+        return {"true": True, "false": False}.get(value.lower(), value)
+
+def read_scenarios(lines, fmt="jsonl"):
+    if fmt == "csv":
+        for row in csv.DictReader(lines):
+            yield {k: _parse_value(v) for k, v in row.items() if v != ""}
+        return
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield json.loads(line)
+
+def evaluate_scenario(scenario: dict):
+    scenario = dict(scenario)
+    _id = scenario.pop("id", None)
+    command = scenario.pop("command", None)
+    record = {"id": _id, "command": command}
+    try:
+        func = COMMANDS[command]
+    except KeyError:
+        record["error"] = f"Unknown command '{command}'. Available are: {', '.join(COMMANDS)}"
+        return record
+    if scenario.get("plot"):
+        # Figures would stay open in the long-running process
+        record["error"] = "Plotting is not supported in batch mode."
+        return record
+    try:
+        record["result"] = _to_json(func(**scenario))
+    except Exception as exc:
+        LOGGER.debug(f"Scenario {_id} failed.", exc_info=True)
+        record["error"] = f"{type(exc).__name__}: {exc}"
+    return record
+
+def run_batch(lines, fmt="jsonl", output=sys.stdout):
+    for scenario in read_scenarios(lines, fmt=fmt):
+        output.write(json.dumps(evaluate_scenario(scenario), allow_nan=False) + "\n")
+        output.flush()
+
+
+class ScenarioRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self._send(200, json.dumps({"commands": list(COMMANDS)}))
+
+    def do_POST(self):
+        _length = int(self.headers.get("Content-Length", 0))
+        _body = self.rfile.read(_length).decode("utf-8")
+        fmt = "csv" if "csv" in self.headers.get("Content-Type", "") else "jsonl"
+        try:
+            records = [json.dumps(evaluate_scenario(scenario), allow_nan=False)
+                       for scenario in read_scenarios(_body.splitlines(), fmt=fmt)]
+        except ValueError as exc:
+            self._send(400, json.dumps({"error": str(exc)}))
+            return
+        self._send(200, "\n".join(records) + "\n")
+
+    def _send(self, status, body):
+        _body = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Content-Length", str(len(_body)))
+        self.end_headers()
+        self.wfile.write(_body)
+
+    def log_message(self, format, *args):
+        LOGGER.debug(format % args)
+
+def serve(host="127.0.0.1", port=8000):
+    server = HTTPServer((host, port), ScenarioRequestHandler)
+    LOGGER.info(f"Serving scenario evaluations on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+def main(input="-", format=None, serve_address=None):
+    if serve_address is not None:
+        host, _, port = serve_address.rpartition(":")
+        serve(host or "127.0.0.1", int(port))
+        return
+    if format is None:
+        format = "csv" if input.endswith(".csv") else "jsonl"
+    if input == "-":
+        run_batch(sys.stdin, fmt=format)
+    else:
+        with open(input, encoding="utf-8", newline="") as _file:
+            run_batch(_file, fmt=format)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", nargs="?", default="-",
+                        help="JSONL or CSV file with one scenario per line (default: stdin)")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default=None)
+    parser.add_argument("--serve", dest="serve_address", default=None,
+                        metavar="[HOST:]PORT", help="Run as local HTTP server")
+    parser.add_argument("--cache", default=None, metavar="DIR",
+                        help="Cache the results on disk in this directory")
+    parser.add_argument("--cache_size", type=float, default=2**30,
+                        help="Maximum size of the disk cache in bytes")
+    parser.add_argument("--trace", default=None,
+                        help="Write a Chrome trace (JSON) of the profiled stages to this file")
+    parser.add_argument("-v", "--verbosity", action="count", default=0,
+                        help="Increase output verbosity")
+    args = vars(parser.parse_args())
+    verb = args.pop("verbosity")
+    trace = args.pop("trace")
+    cache_dir, cache_size = args.pop("cache"), args.pop("cache_size")
+    logging.basicConfig(format="%(asctime)s - %(module)s -- [%(levelname)8s]: %(message)s",
+                        handlers=[
+                            logging.FileHandler("main.log", encoding="utf-8"),
+                            logging.StreamHandler()
+                        ])
+    loglevel = logging.WARNING - verb*10
+    LOGGER.setLevel(loglevel)
+    if cache_dir is not None:
+        enable_disk_cache(cache_dir, max_size=int(cache_size))
+    if verb >= 2 or trace is not None:
+        enable_profiling(trace=trace is not None)
+    main(**args)
+    if is_profiling_enabled():
+        LOGGER.info(f"Profiling summary:\n{format_summary()}")
+        if trace is not None:
+            dump_trace(trace)
@@ -0,0 +1,187 @@
+# Benchmark harness for the power/rate kernels and the optimizer.
+# Every kernel is timed for different input sizes and carrier frequencies. The
+# throughput and the peak memory (traced by tracemalloc) are stored in a JSON
+# file, so that the results of different commits can be compared with
+# --compare.
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from single_frequency import rec_power, crit_dist
+from two_frequencies import (sum_power_envelope, power_eve,
+                             bound_rec_power_two_freq)
+from optimal_frequency_distance import (find_optimal_delta_freq,
+                                        find_optimal_delta_freq_batch)
+from secrecy_rate import max_worst_case_sec_rate, max_worst_case_sec_rate_batch
+from cache import set_cache_size, cache_statistics
+from disk_cache import get_disk_cache, enable_disk_cache, disable_disk_cache
+
+
+FREQUENCIES = (2.4e9, 30e9, 300e9)
+H_TX = 10.
+H_RX = 1.5
+
+
+def _scenarios(num, freq, seed=0):
+    rng = np.random.default_rng(seed)
+    d_min = rng.uniform(10, 50, num)
+    return {"d_min": d_min, "d_max": d_min*rng.uniform(1.2, 3, num),
+            "freq": np.full(num, freq), "h_tx": rng.uniform(5, 15, num),
+            "h_rx": rng.uniform(1, 2, num)}
+
+# Each benchmark returns the function that is timed for a given input size and
+# carrier frequency. Benchmarks with scalar=True only work on size 1.
+def bench_rec_power(num, freq):
+    distance = np.logspace(0, 3, num)
+    return lambda: rec_power(distance, freq, H_TX, H_RX)
+
+def bench_sum_power_envelope(num, freq):
+    distance = np.logspace(0, 3, num)
+    return lambda: sum_power_envelope(distance, freq/10, freq, H_TX, H_RX)
+
+def bench_power_eve(num, freq):
+    distance = np.logspace(0, 3, num)
+    return lambda: power_eve(distance, freq/10, freq, H_TX, H_RX)
+
+def bench_crit_dist(num, freq):
+    return lambda: crit_dist(freq, H_TX, H_RX)
+
+def bench_bound_rec_power_two_freq(num, freq):
+    _s = _scenarios(num, freq)
+    delta_freq = np.logspace(7, np.log10(freq), num)
+    return lambda: bound_rec_power_two_freq(_s["d_min"], _s["d_max"],
+                                            delta_freq, _s["freq"], _s["h_tx"],
+                                            _s["h_rx"])
+
+def bench_find_optimal_delta_freq(num, freq):
+    return lambda: find_optimal_delta_freq(20., 30., freq, H_TX, H_RX)
+
+def bench_find_optimal_delta_freq_batch(num, freq):
+    _s = _scenarios(num, freq)
+    return lambda: find_optimal_delta_freq_batch(**_s)
+
+def bench_max_worst_case_sec_rate(num, freq):
+    return lambda: max_worst_case_sec_rate(20., 30., 100., freq, 100e3, H_TX,
+                                           H_RX, H_RX)
+
+def bench_max_worst_case_sec_rate_batch(num, freq):
+    _s = _scenarios(num, freq)
+    return lambda: max_worst_case_sec_rate_batch(
+            _s["d_min"], _s["d_max"], 4*_s["d_max"], _s["freq"], 100e3,
+            _s["h_tx"], _s["h_rx"], _s["h_rx"])
+
+BENCHMARKS = {
+        "rec_power": (bench_rec_power, False),
+        "sum_power_envelope": (bench_sum_power_envelope, False),
+        "power_eve": (bench_power_eve, False),
+        "crit_dist": (bench_crit_dist, True),
+        "bound_rec_power_two_freq": (bench_bound_rec_power_two_freq, False),
+        "find_optimal_delta_freq": (bench_find_optimal_delta_freq, True),
+        "find_optimal_delta_freq_batch": (bench_find_optimal_delta_freq_batch, False),
+        "max_worst_case_sec_rate": (bench_max_worst_case_sec_rate, True),
+        "max_worst_case_sec_rate_batch": (bench_max_worst_case_sec_rate_batch, False),
+        }
+
+
+def time_function(func, min_time=0.2, repeat=3):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number*min_time/0.2))
+    return min(timer.repeat(repeat=repeat, number=number))/number
+
+def peak_memory(func):
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+def _git_commit():
+    try:
+        _out = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              cwd=REPO_DIR, capture_output=True, text=True)
+        return _out.stdout.strip() or None
+    except OSError:
+        return None
+
+def run_benchmarks(names=None, max_size=int(1e7), frequencies=FREQUENCIES,
+                   min_time=0.2):
+    names = list(BENCHMARKS) if names is None else names
+    sizes = [10**k for k in range(int(np.log10(max_size))+1)]
+    results = []
+    # The scalar benchmarks repeat identical calls, which would only time the
+    # LRU and disk caches. Both are disabled while the benchmarks run.
+    _cache_sizes = {name: info.maxsize for name, info in cache_statistics().items()}
+    _disk_cache = get_disk_cache()
+    set_cache_size(0)
+    disable_disk_cache()
+    try:
+        _run(results, names, sizes, frequencies, min_time)
+    finally:
+        for name, maxsize in _cache_sizes.items():
+            set_cache_size(maxsize, name=name)
+        if _disk_cache is not None:
+            enable_disk_cache(_disk_cache.directory, max_size=_disk_cache.max_size)
+    return {"commit": _git_commit(), "timestamp": time.time(),
+            "python": platform.python_version(), "numpy": np.__version__,
+            "results": results}
+
+def _run(results, names, sizes, frequencies, min_time):
+    with np.errstate(all="ignore"):
+        for name in names:
+            setup, scalar = BENCHMARKS[name]
+            for freq in frequencies:
+                for num in (sizes[:1] if scalar else sizes):
+                    func = setup(num, freq)
+                    _time = time_function(func, min_time=min_time)
+                    _peak = peak_memory(func)
+                    results.append({"name": name, "size": num, "freq": freq,
+                                    "time": _time, "throughput": num/_time,
+                                    "peak_memory": _peak})
+                    print(f"{name:30s} n={num:<9d} f={freq:.1E}  {_time*1e3:10.3f} ms  {num/_time:10.3E} 1/s  {_peak/2**20:9.2f} MiB")
+
+def compare_results(old, new):
+    _old = {(r["name"], r["size"], r["freq"]): r for r in old["results"]}
+    print(f"Comparing {old['commit']} (old) with {new['commit']} (new)")
+    for r in new["results"]:
+        _ref = _old.get((r["name"], r["size"], r["freq"]))
+        if _ref is None:
+            continue
+        print(f"{r['name']:30s} n={r['size']:<9d} f={r['freq']:.1E}  speedup: {_ref['time']/r['time']:7.2f}  memory: {r['peak_memory']/max(_ref['peak_memory'], 1):7.2f}")
+
+def main(output="benchmark-results.json", names=None, max_size=int(1e7),
+         min_time=0.2, compare=None):
+    if compare is not None:
+        with open(compare[0]) as _old, open(compare[1]) as _new:
+            compare_results(json.load(_old), json.load(_new))
+        return
+    results = run_benchmarks(names=names, max_size=max_size, min_time=min_time)
+    with open(output, "w") as _file:
+        json.dump(results, _file, indent=1)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", default="benchmark-results.json")
+    parser.add_argument("-b", "--names", nargs="+", choices=list(BENCHMARKS),
+                        default=None)
+    parser.add_argument("-n", "--max_size", type=lambda x: int(float(x)),
+                        default=int(1e7))
+    parser.add_argument("--min_time", type=float, default=0.2)
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"),
+                        default=None)
+    args = vars(parser.parse_args())
+    main(**args)
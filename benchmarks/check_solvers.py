@@ -0,0 +1,63 @@
+# Consistency check of the vectorized solver find_optimal_delta_freq_batch
+# against the scalar solver find_optimal_delta_freq on a grid of scenarios.
+# A scenario passes if both optimal frequency spacings agree or if the
+# worst-case receive power of Bob at the spacing of the batch solver is not
+# lower than at the one of the scalar solver, i.e., the scalar optimizer got
+# stuck. The script exits with an error if any scenario fails.
+import itertools
+import logging
+import os
+import sys
+
+import numpy as np
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from optimal_frequency_distance import (find_optimal_delta_freq,
+                                        find_optimal_delta_freq_batch)
+from two_frequencies import bound_rec_power_two_freq
+from util import to_decibel
+from disk_cache import disable_disk_cache
+
+
+D_MIN = (1., 5., 20., 50.)
+D_RATIO = (1.1, 2., 10., 60.)
+FREQUENCIES = (2.4e9, 30e9, 300e9)
+H_RX = (.5, 1.5, 5.)
+H_TX = 10.
+
+
+def check_solvers(rtol: float = 1e-6, tol_db: float = 1e-3):
+    scenarios = np.array(list(itertools.product(D_MIN, D_RATIO, FREQUENCIES, H_RX)))
+    d_min, d_ratio, freq, h_rx = scenarios.T
+    d_max = d_min*d_ratio
+    opt_df_batch = find_optimal_delta_freq_batch(d_min, d_max, freq, H_TX, h_rx)
+    failed = []
+    for _scenario, _df_batch in zip(zip(d_min, d_max, freq, h_rx), opt_df_batch):
+        _df_scalar = find_optimal_delta_freq(_scenario[0], _scenario[1],
+                                             _scenario[2], H_TX, _scenario[3])
+        if np.isclose(_df_batch, _df_scalar, rtol=rtol, atol=0):
+            continue
+        _power_batch, _power_scalar = to_decibel(bound_rec_power_two_freq(
+                _scenario[0], _scenario[1], [_df_batch, _df_scalar],
+                _scenario[2], H_TX, _scenario[3]))
+        if _power_batch < _power_scalar - tol_db:
+            failed.append(_scenario)
+            print(f"FAIL d_min={_scenario[0]:.1f} d_max={_scenario[1]:.1f} "
+                  f"f={_scenario[2]:.1E} h_rx={_scenario[3]:.1f}: "
+                  f"batch {_df_batch:E} ({_power_batch:.2f} dB), "
+                  f"scalar {_df_scalar:E} ({_power_scalar:.2f} dB)")
+    print(f"{len(scenarios)-len(failed):d}/{len(scenarios):d} scenarios OK")
+    return bool(failed)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rtol", type=float, default=1e-6)
+    parser.add_argument("--tol_db", type=float, default=1e-3)
+    args = vars(parser.parse_args())
+    logging.basicConfig(level=logging.ERROR)
+    disable_disk_cache()
+    sys.exit(check_solvers(**args))
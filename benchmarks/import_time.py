@@ -0,0 +1,52 @@
+# Import-time benchmark for the command line scripts in batch (headless) mode,
+# i.e., without --plot and --export. None of the heavy optional modules may be
+# loaded and every import has to stay below the target time.
+import json
+import os
+import subprocess
+import sys
+
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ("two_frequencies", "rates", "secrecy_rate",
+           "optimal_frequency_distance", "conditions_positive_zosc", "sweep")
+HEAVY_MODULES = ("matplotlib", "pandas", "scipy.optimize")
+
+_MEASURE_CODE = """
+import json, sys, time
+_start = time.perf_counter()
+import {module}
+_time = time.perf_counter() - _start
+print(json.dumps({{"time": _time, "loaded": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure_import(module: str, repeat: int = 5):
+    _code = _MEASURE_CODE.format(module=module, heavy=HEAVY_MODULES)
+    results = []
+    for _ in range(repeat):
+        _out = subprocess.run([sys.executable, "-c", _code], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True)
+        results.append(json.loads(_out.stdout))
+    return min(r["time"] for r in results), results[0]["loaded"]
+
+def main(target: float = 0.5, repeat: int = 5):
+    failed = False
+    for module in MODULES:
+        _time, _loaded = measure_import(module, repeat=repeat)
+        _status = "OK"
+        if _time > target or _loaded:
+            _status = "FAIL"
+            failed = True
+        print(f"{module:30s} {_time*1e3:8.1f} ms  heavy: {', '.join(_loaded) or '-':20s} {_status}")
+    return failed
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", type=float, default=0.5,
+                        help="Maximum import time in seconds")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = vars(parser.parse_args())
+    sys.exit(main(**args))
@@ -0,0 +1,105 @@
+import functools
+import numbers
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from precision import get_dtype
+
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "bypassed", "maxsize",
+                                     "currsize"])
+
+_REGISTRY = {}
+
+
+class ScalarLRUCache:
+    def __init__(self, func, maxsize: int = 1024, digits: int = 12):
+        self.func = func
+        self.maxsize = maxsize
+        self.digits = digits
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        functools.update_wrapper(self, func)
+
+    def _key_part(self, value):
+        if isinstance(value, (numbers.Real, np.floating, np.integer)):
+            return float(f"{value:.{self.digits}g}")
+        if value is None or isinstance(value, str):
+            return value
+        raise TypeError("Only scalar arguments can be cached.")
+
+    def _make_key(self, args, kwargs):
+        # The compute dtype is part of the key, results of float32 and float64
+        # calls are different
+        try:
+            key = [get_dtype().name] + [self._key_part(value) for value in args]
+            for name, value in sorted(kwargs.items()):
+                key.extend([name, self._key_part(value)])
+        except TypeError:
+            return None
+        return tuple(key)
+
+    def __call__(self, *args, **kwargs):
+        if self.maxsize <= 0:
+            self.bypassed += 1
+            return self.func(*args, **kwargs)
+        key = self._make_key(args, kwargs)
+        if key is None:
+            self.bypassed += 1
+            return self.func(*args, **kwargs)
+        try:
+            result = self._cache[key]
+        except KeyError:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._cache.move_to_end(key)
+            return self._copy(result)
+        result = self.func(*args, **kwargs)
+        self._cache[key] = result
+        result = self._copy(result)
+        while len(self._cache) > self.maxsize:
+            self._cache.popitem(last=False)
+        return result
+
+    def _copy(self, result):
+        # Callers get a copy, so that in-place changes do not alter the cache
+        if isinstance(result, np.ndarray):
+            return result.copy()
+        return result
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self.bypassed, self.maxsize,
+                         len(self._cache))
+
+    def cache_clear(self):
+        self._cache.clear()
+        self.hits = self.misses = self.bypassed = 0
+
+    def resize(self, maxsize: int):
+        self.maxsize = maxsize
+        while len(self._cache) > max(maxsize, 0):
+            self._cache.popitem(last=False)
+
+
+def scalar_lru_cache(maxsize: int = 1024, digits: int = 12):
+    def decorator(func):
+        cached_func = ScalarLRUCache(func, maxsize=maxsize, digits=digits)
+        _REGISTRY[f"{func.__module__}.{func.__qualname__}"] = cached_func
+        return cached_func
+    return decorator
+
+def set_cache_size(maxsize: int, name=None):
+    caches = _REGISTRY.values() if name is None else [_REGISTRY[name]]
+    for _cache in caches:
+        _cache.resize(maxsize)
+
+def cache_statistics():
+    return {name: _cache.cache_info() for name, _cache in _REGISTRY.items()}
+
+def clear_caches():
+    for _cache in _REGISTRY.values():
+        _cache.cache_clear()
@@ -2,61 +2,97 @@ import logging
 
 import numpy as np
 from scipy import constants
-import matplotlib.pyplot as plt
 
 from util import export_results, to_decibel, achievable_rate
 from rates import worst_case_rate_eve
 from two_frequencies import sum_power_envelope, power_eve
-from secrecy_rate import max_worst_case_sec_rate
-from model import length_los, length_ref
+from secrecy_rate import max_worst_case_sec_rate, max_worst_case_sec_rate_batch
+from model import length_los, length_ref, path_difference
+from disk_cache import disk_cached
 
 LOGGER = logging.getLogger(__name__)
 
 
 def delta_freq_pi(distance, h_tx, h_rx, c=constants.c):
-    _len_los = length_los(distance, h_tx, h_rx)
-    _len_ref = length_ref(distance, h_tx, h_rx)
-    dw = (c*np.pi)/(_len_ref-_len_los)
+    dw = (c*np.pi)/path_difference(distance, h_tx, h_rx)
     df = dw/(2*np.pi)
     return df
 
-def is_zosc_definitely_positive(d_min_bob: float, d_max_bob: float,
-                                d_min_eve: float, freq: float, h_tx: float,
-                                h_rx_bob: float, h_rx_eve: float,
-                                c=constants.c):
-    _df_dmin = delta_freq_pi(d_min_bob, h_tx, h_rx_bob)
+def _sufficient_condition_terms(d_min_bob, d_max_bob, d_min_eve, freq, h_tx,
+                                h_rx_bob, h_rx_eve, c=constants.c):
+    _df_dmin = delta_freq_pi(d_min_bob, h_tx, h_rx_bob, c=c)
     power_bound_bob = sum_power_envelope(d_max_bob, _df_dmin, freq, h_tx,
-                                         h_rx_bob, bound="lower")
-    power_bound_eve = power_eve(d_min_eve, 0., freq, h_tx, h_rx_eve)
-    LOGGER.info(f"LHS:\t{to_decibel(power_bound_bob):.1f}")
-    LOGGER.info(f"RHS:\t{to_decibel(power_bound_eve):.1f}")
-    return power_bound_bob > power_bound_eve
+                                         h_rx_bob, bound="lower", c=c)
+    power_bound_eve = power_eve(d_min_eve, 0., freq, h_tx, h_rx_eve, c=c)
+    return power_bound_bob, power_bound_eve
 
-def can_zosc_be_positive(d_max_bob: float, d_min_eve: float,
-                                h_tx: float, h_rx_bob: float, h_rx_eve: float,
-                                c=constants.c):
+def _necessary_condition_terms(d_max_bob, d_min_eve, h_tx, h_rx_bob, h_rx_eve):
     _bob = 1./length_los(d_max_bob, h_tx, h_rx_bob)**2 + 1./length_ref(d_max_bob, h_tx, h_rx_bob)**2
     _eve = 1./length_los(d_min_eve, h_tx, h_rx_eve)**2 + 1./length_ref(d_min_eve, h_tx, h_rx_eve)**2
-    LOGGER.info(f"LHS:\t{_bob:E}")
-    LOGGER.info(f"RHS:\t{_eve:E}")
+    return _bob, _eve
+
+def is_zosc_definitely_positive(d_min_bob, d_max_bob, d_min_eve, freq, h_tx,
+                                h_rx_bob, h_rx_eve, c=constants.c):
+    power_bound_bob, power_bound_eve = _sufficient_condition_terms(
+            d_min_bob, d_max_bob, d_min_eve, freq, h_tx, h_rx_bob, h_rx_eve,
+            c=c)
+    return power_bound_bob > power_bound_eve
+
+def can_zosc_be_positive(d_max_bob, d_min_eve, h_tx, h_rx_bob, h_rx_eve,
+                         c=constants.c):
+    _bob, _eve = _necessary_condition_terms(d_max_bob, d_min_eve, h_tx,
+                                            h_rx_bob, h_rx_eve)
     return _bob > _eve
 
+def is_zosc_positive(d_min_bob, d_max_bob, d_min_eve, freq, bw, h_tx,
+                     h_rx_bob, h_rx_eve, c=constants.c):
+    # Cheap filter first: the necessary and sufficient conditions decide most
+    # combinations. Only the undecided ones are passed to the exact solver.
+    params = np.broadcast_arrays(d_min_bob, d_max_bob, d_min_eve, freq, bw,
+                                 h_tx, h_rx_bob, h_rx_eve)
+    d_min_bob, d_max_bob, d_min_eve, freq, bw, h_tx, h_rx_bob, h_rx_eve = params
+    necessary = can_zosc_be_positive(d_max_bob, d_min_eve, h_tx, h_rx_bob,
+                                     h_rx_eve, c=c)
+    sufficient = is_zosc_definitely_positive(d_min_bob, d_max_bob, d_min_eve,
+                                             freq, h_tx, h_rx_bob, h_rx_eve,
+                                             c=c)
+    positive = np.array(necessary & sufficient)
+    undecided = necessary & ~sufficient
+    LOGGER.debug(f"Undecided by the conditions: {np.count_nonzero(undecided):d} out of {undecided.size:d}")
+    if np.any(undecided):
+        _zosc = max_worst_case_sec_rate_batch(*[p[undecided] for p in params])
+        positive[undecided] = _zosc > 0
+    return positive[()]
 
+
+def _log_results(results):
+    LOGGER.info(f"LHS:\t{results['necessaryBob']:E}")
+    LOGGER.info(f"RHS:\t{results['necessaryEve']:E}")
+    LOGGER.info(f"ZOSC can be positive (necessary condition): {results['necessary']}")
+    LOGGER.info(f"LHS:\t{to_decibel(results['sufficientBob']):.1f}")
+    LOGGER.info(f"RHS:\t{to_decibel(results['sufficientEve']):.1f}")
+    LOGGER.info(f"ZOSC is definitely positive (sufficient condition): {results['sufficient']}")
+    LOGGER.info(f"Actual ZOSC: {results['zosc']:E}")
+
+@disk_cached(on_hit=_log_results)
 def main(d_min_bob: float, d_max_bob: float, d_min_eve: float, freq:float,
          bw: float, h_tx: float, h_rx_bob: float, h_rx_eve: float):
-    zosc_prob_zero = can_zosc_be_positive(d_max_bob, d_min_eve, h_tx, h_rx_bob,
-                                          h_rx_eve)
-    LOGGER.info(f"ZOSC can be positive (necessary condition): {zosc_prob_zero}")
+    _bob, _eve = _necessary_condition_terms(d_max_bob, d_min_eve, h_tx,
+                                            h_rx_bob, h_rx_eve)
+    zosc_prob_zero = _bob > _eve
 
-    zosc_def_positive = is_zosc_definitely_positive(d_min_bob, d_max_bob,
-                                                    d_min_eve, freq, h_tx,
-                                                    h_rx_bob, h_rx_eve)
-    LOGGER.info(f"ZOSC is definitely positive (sufficient condition): {zosc_def_positive}")
+    power_bound_bob, power_bound_eve = _sufficient_condition_terms(
+            d_min_bob, d_max_bob, d_min_eve, freq, h_tx, h_rx_bob, h_rx_eve)
+    zosc_def_positive = power_bound_bob > power_bound_eve
 
     actual_zosc = max_worst_case_sec_rate(d_min_bob, d_max_bob, d_min_eve,
                                           freq, bw, h_tx, h_rx_bob, h_rx_eve)
-    LOGGER.info(f"Actual ZOSC: {actual_zosc:E}")
-
+    results = {"necessary": zosc_prob_zero, "sufficient": zosc_def_positive,
+               "zosc": actual_zosc, "necessaryBob": _bob,
+               "necessaryEve": _eve, "sufficientBob": power_bound_bob,
+               "sufficientEve": power_bound_eve}
+    _log_results(results)
+    return results
 
 if __name__ == "__main__":
     import argparse
@@ -81,4 +117,3 @@ if __name__ == "__main__":
     loglevel = logging.WARNING - verb*10
     LOGGER.setLevel(loglevel)
     main(**args)
-    plt.show()
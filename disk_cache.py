@@ -0,0 +1,281 @@
+import contextlib
+import functools
+import hashlib
+import inspect
+import io
+import json
+import logging
+import numbers
+import os
+import tempfile
+
+import numpy as np
+
+from precision import get_dtype
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Results of the decorated functions are stored in
+#   <directory>/<key[:2]>/<key>.npz
+# where the key is the SHA-256 of the function name, its normalized arguments,
+# the compute dtype and the code version (a hash of all modules of this
+# repository). Files are
+# written atomically. The total size of the entries is tracked in
+# <directory>/.size. Only if it exceeds max_size, the least recently used
+# entries are evicted until the total is below EVICTION_TARGET*max_size.
+_CACHE = None
+_code_version = None
+
+# Calls with any of these arguments set have side effects and are not cached
+SIDE_EFFECT_ARGS = ("plot", "export", "axs", "plotter")
+EVICTION_TARGET = 0.9
+
+
+def code_version():
+    global _code_version
+    if _code_version is None:
+        _hash = hashlib.sha256(np.__version__.encode())
+        _dir = os.path.dirname(os.path.abspath(__file__))
+        for _name in sorted(os.listdir(_dir)):
+            if _name.endswith(".py"):
+                with open(os.path.join(_dir, _name), "rb") as _file:
+                    _hash.update(_name.encode())
+                    _hash.update(_file.read())
+        _code_version = _hash.hexdigest()
+    return _code_version
+
+def _normalize(value, digits=12):
+    if isinstance(value, (bool, np.bool_)) or value is None or isinstance(value, str):
+        return value if not isinstance(value, np.bool_) else bool(value)
+    if isinstance(value, (numbers.Real, np.floating, np.integer)):
+        return float(f"{value:.{digits}g}")
+    if isinstance(value, (list, tuple, np.ndarray)):
+        _array = np.asarray(value)
+        if _array.dtype.kind not in "biuf":
+            raise TypeError("Only numeric arrays can be cached.")
+        return {"shape": _array.shape,
+                "data": [float(f"{v:.{digits}g}") for v in _array.ravel()]}
+    raise TypeError(f"Arguments of type {type(value).__name__} can not be cached.")
+
+def _flatten(value):
+    # Results are arrays/scalars or dicts/tuples of them
+    if isinstance(value, dict):
+        items = {f"d:{k}": v for k, v in value.items()}
+    elif isinstance(value, tuple):
+        items = {f"t:{i:d}": v for i, v in enumerate(value)}
+    else:
+        items = {"v": value}
+    arrays = {k: np.asarray(v) for k, v in items.items()}
+    if any(a.dtype.kind not in "biufc" for a in arrays.values()):
+        raise TypeError("Only numeric results can be cached.")
+    return arrays
+
+def _unflatten(arrays):
+    keys = list(arrays)
+    values = [arrays[k][()] for k in keys]
+    if keys == ["v"]:
+        return values[0]
+    if keys and keys[0].startswith("t:"):
+        return tuple(values)
+    return {k[2:]: v for k, v in zip(keys, values)}
+
+
+class DiskCache:
+    def __init__(self, directory, max_size: int = 2**30):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        os.makedirs(directory, exist_ok=True)
+        with self._lock():
+            if not os.path.exists(self._size_path()):
+                self._write_size(self.size())
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.npz")
+
+    def _size_path(self):
+        return os.path.join(self.directory, ".size")
+
+    @contextlib.contextmanager
+    def _lock(self):
+        with open(os.path.join(self.directory, ".lock"), "w") as _lock:
+            if fcntl is not None:
+                fcntl.flock(_lock, fcntl.LOCK_EX)
+            yield
+
+    def _read_size(self):
+        # Only called with the lock held. A missing or broken size file is
+        # rebuilt from the directory.
+        try:
+            with open(self._size_path()) as _file:
+                return int(_file.read())
+        except (FileNotFoundError, ValueError):
+            return self.size()
+
+    def _write_size(self, size):
+        with open(self._size_path(), "w") as _file:
+            _file.write(f"{size:d}")
+
+    def get(self, key):
+        _path = self._path(key)
+        try:
+            with open(_path, "rb") as _file:
+                _data = _file.read()
+            with np.load(io.BytesIO(_data), allow_pickle=False) as arrays:
+                result = _unflatten({k: arrays[k] for k in arrays.files})
+        except FileNotFoundError:
+            return None
+        except Exception:
+            LOGGER.warning(f"Removing the corrupted cache entry '{_path}'.")
+            self._remove(_path)
+            return None
+        try:
+            os.utime(_path)
+        except OSError:
+            pass
+        return result
+
+    def put(self, key, value):
+        _path = self._path(key)
+        os.makedirs(os.path.dirname(_path), exist_ok=True)
+        _buffer = io.BytesIO()
+        np.savez_compressed(_buffer, **_flatten(value))
+        try:
+            _old_size = os.stat(_path).st_size
+        except FileNotFoundError:
+            _old_size = 0
+        # Atomic write: concurrent readers see either the old or the new file
+        _fd, _tmp_path = tempfile.mkstemp(dir=os.path.dirname(_path),
+                                          suffix=".tmp")
+        try:
+            with os.fdopen(_fd, "wb") as _file:
+                _file.write(_buffer.getvalue())
+            os.replace(_tmp_path, _path)
+        except BaseException:
+            self._remove(_tmp_path)
+            raise
+        # Concurrent writes of the same key can make the total drift, which
+        # is corrected by the directory scan of the next eviction
+        with self._lock():
+            _total = self._read_size() + _buffer.getbuffer().nbytes - _old_size
+            if _total > self.max_size:
+                _total = self._evict()
+            self._write_size(_total)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _entries(self):
+        entries = []
+        for _root, _dirs, _files in os.walk(self.directory):
+            for _name in _files:
+                if not _name.endswith(".npz"):
+                    continue
+                _path = os.path.join(_root, _name)
+                try:
+                    _stat = os.stat(_path)
+                except FileNotFoundError:
+                    continue
+                entries.append((_stat.st_mtime, _stat.st_size, _path))
+        return entries
+
+    def size(self):
+        return sum(_size for _, _size, _ in self._entries())
+
+    def _evict(self):
+        # Remove the least recently used entries until the total size is
+        # below EVICTION_TARGET*max_size, so that the following writes do not
+        # scan the directory again. Only called with the lock held.
+        entries = sorted(self._entries())
+        _total = sum(_size for _, _size, _ in entries)
+        for _, _size, _path in entries:
+            if _total <= EVICTION_TARGET*self.max_size:
+                break
+            self._remove(_path)
+            _total -= _size
+            LOGGER.debug(f"Evicted cache entry '{_path}'.")
+        return _total
+
+    def evict(self):
+        with self._lock():
+            self._write_size(self._evict())
+
+    def clear(self):
+        with self._lock():
+            for _, _, _path in self._entries():
+                self._remove(_path)
+            self._write_size(0)
+        self.hits = self.misses = self.bypassed = 0
+
+
+def enable_disk_cache(directory, max_size: int = 2**30):
+    global _CACHE
+    _CACHE = DiskCache(directory, max_size=max_size)
+    return _CACHE
+
+def disable_disk_cache():
+    global _CACHE
+    _CACHE = None
+
+def get_disk_cache():
+    return _CACHE
+
+def disk_cached(func=None, on_hit=None):
+    # Cache the results of func on disk while the disk cache is enabled.
+    # Calls with side effects (plots, exported files) or arguments that can
+    # not be normalized are always evaluated. on_hit(result) is called for
+    # results read from the cache, e.g., to repeat the log output of func.
+    if func is None:
+        return functools.partial(disk_cached, on_hit=on_hit)
+    _signature = inspect.signature(func)
+    _name = f"{func.__module__}.{func.__qualname__}"
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _CACHE is None:
+            return func(*args, **kwargs)
+        _bound = _signature.bind(*args, **kwargs)
+        _bound.apply_defaults()
+        _arguments = dict(_bound.arguments)
+        if any(_arguments.get(k) for k in SIDE_EFFECT_ARGS):
+            _CACHE.bypassed += 1
+            return func(*args, **kwargs)
+        try:
+            _params = {k: _normalize(v) for k, v in _arguments.items()}
+        except TypeError:
+            _CACHE.bypassed += 1
+            return func(*args, **kwargs)
+        _key = hashlib.sha256(json.dumps(
+            {"func": _name, "version": code_version(), "params": _params,
+             "dtype": get_dtype().name},
+            sort_keys=True).encode()).hexdigest()
+        result = _CACHE.get(_key)
+        if result is not None:
+            _CACHE.hits += 1
+            LOGGER.debug(f"Disk cache hit for {_name}.")
+            if on_hit is not None:
+                on_hit(result)
+            return result
+        _CACHE.misses += 1
+        result = func(*args, **kwargs)
+        try:
+            _CACHE.put(_key, result)
+        except TypeError:
+            LOGGER.debug(f"The result of {_name} can not be cached.")
+        return result
+    return wrapper
+
+if os.environ.get("TWO_RAY_DISK_CACHE"):
+    enable_disk_cache(os.environ["TWO_RAY_DISK_CACHE"],
+                      max_size=int(float(os.environ.get("TWO_RAY_DISK_CACHE_SIZE", 2**30))))
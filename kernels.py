@@ -0,0 +1,121 @@
+import logging
+
+import numpy as np
+from scipy import constants
+
+from model import lengths, path_difference_from_lengths
+from single_frequency import crit_dist_index_range, crit_dist_k
+from profiling import profiled
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+
+LOGGER = logging.getLogger(__name__)
+
+_ENVELOPE_EXPR = ("K*((A+B)*(path_diff/(d_los*d_ref))**2 "
+                  "+ 8*A*B*sin(delta_omega/c*path_diff/2)**2 "
+                  "/ (d_los*d_ref*(A + B + sqrt(A**2 + B**2 "
+                  "+ 2*A*B*cos(delta_omega/c*path_diff)))))")
+
+
+def _lower_envelope_numpy(d_los, d_ref, path_diff, A, B, delta_omega, K, c,
+                          out, tmp):
+    # Same as sum_power_envelope(bound="lower") with precomputed A and B. The
+    # square root term is sqrt((A+B)**2 - 4*A*B*sin(x/2)**2).
+    _inv_prod = 1/(d_los*d_ref)
+    np.multiply(delta_omega, path_diff/(2*c), out=tmp)
+    np.sin(tmp, out=tmp)
+    np.square(tmp, out=tmp)
+    tmp *= A
+    tmp *= B
+    tmp *= 4
+    np.add(A, B, out=out)
+    np.square(out, out=out)
+    out -= tmp
+    np.maximum(out, 0, out=out)
+    np.sqrt(out, out=out)
+    out += A
+    out += B
+    np.divide(tmp, out, out=tmp)
+    tmp *= 2*_inv_prod
+    np.add(A, B, out=out)
+    out *= (path_diff*_inv_prod)**2
+    out += tmp
+    out *= K
+    return out
+
+def _lower_envelope_numexpr(d_los, d_ref, path_diff, A, B, delta_omega, K, c,
+                            out, tmp):
+    return numexpr.evaluate(_ENVELOPE_EXPR, out=out, casting="unsafe",
+                            local_dict={"d_los": d_los, "d_ref": d_ref,
+                                        "path_diff": path_diff, "A": A,
+                                        "B": B, "delta_omega": delta_omega,
+                                        "K": K, "c": c})
+
+def _rate_inplace(power, bw, noise_den_db, out):
+    # Same as util.achievable_rate
+    noise_power = 10**(noise_den_db/10.)*bw
+    np.divide(power, noise_power, out=out)
+    np.log1p(out, out=out)
+    out *= bw/np.log(2)
+    return out
+
+@profiled()
+def secrecy_rates(d_min_bob, d_max_bob, d_min_eve, delta_freq, freq, bw, h_tx,
+                  h_rx_bob, h_rx_eve, theta=0.5, c=constants.c, power_tx=1,
+                  noise_den_db=-174, out=None, backend="auto"):
+    if backend == "auto":
+        backend = "numpy" if numexpr is None else "numexpr"
+    if backend == "numexpr" and numexpr is None:
+        LOGGER.warning("numexpr is not installed. Falling back to NumPy.")
+        backend = "numpy"
+    _envelope = _lower_envelope_numexpr if backend == "numexpr" else _lower_envelope_numpy
+
+    shape = np.broadcast_shapes(*map(np.shape, (
+        d_min_bob, d_max_bob, d_min_eve, delta_freq, freq, bw, h_tx, h_rx_bob,
+        h_rx_eve, theta)))
+    if out is None:
+        out = tuple(np.empty(shape) for _ in range(3))
+    rate_bob, rate_eve, rate_sec = out
+    A, B, tmp1, tmp2 = (np.empty(shape) for _ in range(4))
+
+    # Power weights of both carriers, shared by Bob's bound at all distances
+    omega = 2*np.pi*freq
+    delta_omega = 2*np.pi*delta_freq
+    np.divide(theta, omega**2, out=A)
+    np.add(omega, delta_omega, out=B)
+    np.square(B, out=B)
+    np.divide(1-theta, B, out=B)
+    K = power_tx*(c/2)**2
+
+    # Bob: lower envelope at d_min, d_max and the worst critical distance
+    d_los, d_ref = lengths(d_min_bob, h_tx, h_rx_bob)
+    _path_diff = path_difference_from_lengths(d_los, d_ref, h_tx, h_rx_bob)
+    _envelope(d_los, d_ref, _path_diff, A, B, delta_omega, K, c, rate_bob, tmp1)
+    d_los, d_ref = lengths(d_max_bob, h_tx, h_rx_bob)
+    _path_diff = path_difference_from_lengths(d_los, d_ref, h_tx, h_rx_bob)
+    _envelope(d_los, d_ref, _path_diff, A, B, delta_omega, K, c, tmp2, tmp1)
+    np.minimum(rate_bob, tmp2, out=rate_bob)
+    k_first, k_last = crit_dist_index_range(d_min_bob, d_max_bob, delta_freq,
+                                            h_tx, h_rx_bob, c=c)
+    has_dk = np.broadcast_to(k_first <= k_last, shape)
+    if np.any(has_dk):
+        dk_worst = np.where(has_dk, crit_dist_k(k_first, delta_freq, h_tx,
+                                                h_rx_bob, c=c), d_min_bob)
+        d_los, d_ref = lengths(dk_worst, h_tx, h_rx_bob)
+        _path_diff = path_difference_from_lengths(d_los, d_ref, h_tx, h_rx_bob)
+        _envelope(d_los, d_ref, _path_diff, A, B, delta_omega, K, c, tmp2, tmp1)
+        np.minimum(rate_bob, tmp2, out=rate_bob, where=has_dk)
+    _rate_inplace(rate_bob, bw, noise_den_db, rate_bob)
+
+    # Eve: worst-case upper bound power_eve(d_min_eve, 0)
+    d_los, d_ref = lengths(d_min_eve, h_tx, h_rx_eve)
+    np.copyto(rate_eve, K/omega**2 * (1/d_los + 1/d_ref)**2)
+    _rate_inplace(rate_eve, bw, noise_den_db, rate_eve)
+
+    np.subtract(rate_bob, rate_eve, out=rate_sec)
+    np.maximum(rate_sec, 0, out=rate_sec)
+    return rate_bob[()], rate_eve[()], rate_sec[()]
@@ -1,7 +1,44 @@
 import numpy as np
 
+
+class Geometry:
+    def __init__(self, distance, h_tx, h_rx):
+        self.distance = distance
+        self.h_tx = h_tx
+        self.h_rx = h_rx
+        self.d_los = length_los(distance, h_tx, h_rx)
+        self.d_ref = length_ref(distance, h_tx, h_rx)
+        self.path_diff = path_difference_from_lengths(self.d_los, self.d_ref,
+                                                      h_tx, h_rx)
+
 def length_los(distance, h_tx, h_rx):
     return np.sqrt(distance**2 + (h_tx-h_rx)**2)
 
 def length_ref(distance, h_tx, h_rx):
     return np.sqrt(distance**2 + (h_tx+h_rx)**2)
+
+def lengths(distance, h_tx, h_rx):
+    if isinstance(distance, Geometry):
+        if not (np.array_equal(distance.h_tx, h_tx) and
+                np.array_equal(distance.h_rx, h_rx)):
+            raise ValueError("The heights do not match the provided geometry.")
+        return distance.d_los, distance.d_ref
+    return length_los(distance, h_tx, h_rx), length_ref(distance, h_tx, h_rx)
+
+def path_difference_from_lengths(d_los, d_ref, h_tx, h_rx):
+    # Same as d_ref-d_los without the cancellation of the two nearly equal
+    # lengths at large distances, since d_ref**2-d_los**2 = 4*h_tx*h_rx
+    return 4*h_tx*h_rx/(d_ref+d_los)
+
+def path_difference(distance, h_tx, h_rx):
+    if isinstance(distance, Geometry):
+        lengths(distance, h_tx, h_rx)
+        return distance.path_diff
+    d_los, d_ref = lengths(distance, h_tx, h_rx)
+    return path_difference_from_lengths(d_los, d_ref, h_tx, h_rx)
+
+def distance_from_path_diff(path_diff, h_tx, h_rx):
+    # Inverse of length_ref-length_los. Values outside the valid range of the
+    # path difference are mapped to zero.
+    _d_sq = (4*h_rx**2 - path_diff**2)*(4*h_tx**2 - path_diff**2)
+    return np.sqrt(np.maximum(_d_sq, 0))/(2*path_diff)
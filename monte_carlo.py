@@ -0,0 +1,220 @@
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+
+import numpy as np
+from scipy import constants
+
+from single_frequency import rec_power
+from two_frequencies import sum_power
+from util import achievable_rate, to_decibel
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Bob is uniformly distributed in [d_min_bob, d_max_bob] and Eve in
+# [d_min_eve, d_max_eve]. Receiver heights are either fixed or uniformly
+# distributed in a (low, high) range. Without delta_freq, a single carrier is
+# used.
+POWER_BINS = np.linspace(-250, 0, 2501)
+RATE_BINS = np.concatenate([[0], np.logspace(0, 9, 901)])
+
+
+def _sample(rng, value, size):
+    if np.ndim(value) == 0:
+        return value
+    return rng.uniform(value[0], value[1], size=size)
+
+def _power(distance, delta_freq, freq, h_tx, h_rx, c):
+    if delta_freq is None:
+        return rec_power(distance, freq, h_tx, h_rx, c=c)
+    return sum_power(distance, delta_freq, freq, h_tx, h_rx, c=c)
+
+def _histogram(values, bins):
+    # Counts including the under- and overflow bins at both ends
+    return np.bincount(np.searchsorted(bins, values, side="right"),
+                       minlength=len(bins)+1)
+
+def evaluate_batches(scenario: dict, seed, batch_size: int, num_batches: int,
+                     c=constants.c):
+    # Sample num_batches*batch_size positions and return only the counts and
+    # histograms of them.
+    rng = np.random.default_rng(seed)
+    counts = {"samples": 0, "outage": 0, "secrecy_outage": 0,
+              "hist_power_bob": np.zeros(len(POWER_BINS)+1, dtype=np.int64),
+              "hist_power_eve": np.zeros(len(POWER_BINS)+1, dtype=np.int64),
+              "hist_sec_rate": np.zeros(len(RATE_BINS)+1, dtype=np.int64)}
+    for _batch in range(num_batches):
+        d_bob = rng.uniform(scenario["d_min_bob"], scenario["d_max_bob"],
+                            size=batch_size)
+        d_eve = rng.uniform(scenario["d_min_eve"], scenario["d_max_eve"],
+                            size=batch_size)
+        h_rx_bob = _sample(rng, scenario["h_rx_bob"], batch_size)
+        h_rx_eve = _sample(rng, scenario["h_rx_eve"], batch_size)
+        power_bob = _power(d_bob, scenario["delta_freq"], scenario["freq"],
+                           scenario["h_tx"], h_rx_bob, c)
+        power_eve = _power(d_eve, scenario["delta_freq"], scenario["freq"],
+                           scenario["h_tx"], h_rx_eve, c)
+        rate_bob = achievable_rate(power_bob, scenario["bw"])
+        sec_rate = np.maximum(rate_bob - achievable_rate(power_eve, scenario["bw"]), 0)
+        counts["samples"] += batch_size
+        counts["outage"] += np.count_nonzero(rate_bob < scenario["rate_bob"])
+        counts["secrecy_outage"] += np.count_nonzero(sec_rate < scenario["sec_rate"])
+        counts["hist_power_bob"] += _histogram(to_decibel(power_bob), POWER_BINS)
+        counts["hist_power_eve"] += _histogram(to_decibel(power_eve), POWER_BINS)
+        counts["hist_sec_rate"] += _histogram(sec_rate, RATE_BINS)
+    return counts
+
+def confidence_halfwidth(num_events, num_samples, confidence=0.95):
+    # Wilson score interval of the binomial proportion, which does not
+    # collapse to zero width if no events have been observed yet
+    z = NormalDist().inv_cdf(.5 + confidence/2)
+    p = num_events/num_samples
+    return (z/(1 + z**2/num_samples)
+            * np.sqrt(p*(1-p)/num_samples + z**2/(4*num_samples**2)))
+
+def histogram_quantile(hist, bins, q):
+    # Quantiles from a histogram with under- and overflow bins. Values in the
+    # under-/overflow bins are reported as -inf/inf.
+    _cdf = np.cumsum(hist)/np.sum(hist)
+    idx = np.searchsorted(_cdf, q, side="left")
+    _edges = np.concatenate([[-np.inf], bins, [np.inf]])
+    _low, _high = _edges[idx], _edges[idx+1]
+    _cdf_low = np.where(idx > 0, _cdf[np.maximum(idx-1, 0)], 0)
+    _weight = (q-_cdf_low)/np.maximum(_cdf[idx]-_cdf_low, np.finfo(float).tiny)
+    with np.errstate(invalid="ignore"):
+        quantile = np.where(np.isfinite(_low) & np.isfinite(_high),
+                            _low + _weight*(_high-_low),
+                            np.where(np.isfinite(_low), _high, _low))
+    return quantile[()]
+
+def monte_carlo(d_min_bob, d_max_bob, d_min_eve, d_max_eve, freq, bw, h_tx,
+                h_rx_bob, h_rx_eve, rate_bob, sec_rate, delta_freq=None,
+                batch_size: int = 1000000, batches_per_task: int = 10,
+                max_samples: int = 10**9, ci_halfwidth: float = 1e-4,
+                confidence: float = 0.95, seed=None, max_workers=None,
+                c=constants.c):
+    # Outage probability P(R_B < rate_bob) and secrecy outage probability
+    # P(R_S < sec_rate). Tasks with independent seeds (SeedSequence.spawn)
+    # are evaluated in parallel until the confidence intervals of both
+    # probabilities are narrower than ci_halfwidth or max_samples is reached.
+    # Results are added in submission order, so the totals and the stopping
+    # point only depend on the seed.
+    scenario = {"d_min_bob": d_min_bob, "d_max_bob": d_max_bob,
+                "d_min_eve": d_min_eve, "d_max_eve": d_max_eve, "freq": freq,
+                "bw": bw, "h_tx": h_tx, "h_rx_bob": h_rx_bob,
+                "h_rx_eve": h_rx_eve, "delta_freq": delta_freq,
+                "rate_bob": rate_bob, "sec_rate": sec_rate}
+    seed_seq = np.random.SeedSequence(seed)
+    _task_samples = batch_size*batches_per_task
+    total = None
+    converged = False
+    _time_start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        _num_workers = max_workers or os.cpu_count()
+        _num_submitted = 0
+        pending = deque()
+        while True:
+            while (len(pending) < 2*_num_workers and
+                   _num_submitted*_task_samples < max_samples):
+                pending.append(executor.submit(evaluate_batches, scenario,
+                                               seed_seq.spawn(1)[0], batch_size,
+                                               batches_per_task, c=c))
+                _num_submitted += 1
+            if not pending:
+                break
+            _counts = pending.popleft().result()
+            if total is None:
+                total = _counts
+            else:
+                for key, value in _counts.items():
+                    total[key] += value
+            _n = total["samples"]
+            _hw_outage = confidence_halfwidth(total["outage"], _n, confidence)
+            _hw_sec = confidence_halfwidth(total["secrecy_outage"], _n, confidence)
+            LOGGER.info(f"{_n:d} samples (elapsed: {time.perf_counter()-_time_start:.1f} s): "
+                        f"outage {total['outage']/_n:.3E} +- {_hw_outage:.1E}, "
+                        f"secrecy outage {total['secrecy_outage']/_n:.3E} +- {_hw_sec:.1E}")
+            if max(_hw_outage, _hw_sec) < ci_halfwidth:
+                converged = True
+                for future in pending:
+                    future.cancel()
+                break
+    if not converged:
+        LOGGER.warning(f"The confidence interval did not reach {ci_halfwidth} after {total['samples']:d} samples.")
+    _n = total["samples"]
+    _quantiles = np.array([.01, .05, .1, .5])
+    return {"samples": _n, "converged": converged,
+            "outage": total["outage"]/_n,
+            "outageCI": confidence_halfwidth(total["outage"], _n, confidence),
+            "secrecyOutage": total["secrecy_outage"]/_n,
+            "secrecyOutageCI": confidence_halfwidth(total["secrecy_outage"], _n, confidence),
+            "quantiles": _quantiles,
+            "powerBobQuantiles": histogram_quantile(total["hist_power_bob"], POWER_BINS, _quantiles),
+            "secRateQuantiles": histogram_quantile(total["hist_sec_rate"], RATE_BINS, _quantiles),
+            "histPowerBob": total["hist_power_bob"],
+            "histPowerEve": total["hist_power_eve"],
+            "histSecRate": total["hist_sec_rate"]}
+
+def main(d_min_bob, d_max_bob, d_min_eve, d_max_eve, freq, bw, h_tx, h_rx_bob,
+         h_rx_eve, rate_bob, sec_rate, delta_freq=None, batch_size=1000000,
+         max_samples=10**8, ci_halfwidth=1e-4, seed=None, workers=None,
+         export=False):
+    h_rx_bob = h_rx_bob[0] if len(h_rx_bob) == 1 else h_rx_bob
+    h_rx_eve = h_rx_eve[0] if len(h_rx_eve) == 1 else h_rx_eve
+    results = monte_carlo(d_min_bob, d_max_bob, d_min_eve, d_max_eve, freq, bw,
+                          h_tx, h_rx_bob, h_rx_eve, rate_bob, sec_rate,
+                          delta_freq=delta_freq, batch_size=batch_size,
+                          max_samples=max_samples, ci_halfwidth=ci_halfwidth,
+                          seed=seed, max_workers=workers)
+    LOGGER.info(f"Outage probability: {results['outage']:E} +- {results['outageCI']:.1E}")
+    LOGGER.info(f"Secrecy outage probability: {results['secrecyOutage']:E} +- {results['secrecyOutageCI']:.1E}")
+    for _q, _power, _rate in zip(results["quantiles"], results["powerBobQuantiles"],
+                                 results["secRateQuantiles"]):
+        LOGGER.info(f"{_q:.0%} quantile: power Bob {_power:.2f} dB, secrecy rate {_rate:E}")
+
+    if export:
+        LOGGER.debug("Exporting results.")
+        fname = f"monte-carlo-{freq:E}-t{h_tx:.1f}-dminB{d_min_bob:.1f}-dmaxB{d_max_bob:.1f}-dminE{d_min_eve:.1f}.npz"
+        np.savez(fname, powerBins=POWER_BINS, rateBins=RATE_BINS, **results)
+    return results
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", "--h_tx", type=float, default=10.)
+    parser.add_argument("-r", "--h_rx_bob", type=float, default=[1.5], nargs="+",
+                        help="Height of Bob or range (low, high)")
+    parser.add_argument("-re", "--h_rx_eve", type=float, default=[1.5], nargs="+",
+                        help="Height of Eve or range (low, high)")
+    parser.add_argument("-f", "--freq", type=float, default=2.4e9)
+    parser.add_argument("-df", "--delta_freq", type=float, default=None)
+    parser.add_argument("-w", "--bw", type=float, default=100e3)
+    parser.add_argument("-dmin", "--d_min_bob", type=float, default=20.)
+    parser.add_argument("-dmax", "--d_max_bob", type=float, default=30.)
+    parser.add_argument("-e", "--d_min_eve", type=float, default=100.)
+    parser.add_argument("-emax", "--d_max_eve", type=float, default=1000.)
+    parser.add_argument("-R", "--rate_bob", type=float, default=1e6)
+    parser.add_argument("-Rs", "--sec_rate", type=float, default=1e5)
+    parser.add_argument("--batch_size", type=int, default=1000000)
+    parser.add_argument("--max_samples", type=int, default=10**8)
+    parser.add_argument("--ci_halfwidth", type=float, default=1e-4)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--export", action="store_true")
+    parser.add_argument("-v", "--verbosity", action="count", default=0,
+                        help="Increase output verbosity")
+    args = vars(parser.parse_args())
+    verb = args.pop("verbosity")
+    logging.basicConfig(format="%(asctime)s - %(module)s -- [%(levelname)8s]: %(message)s",
+                        handlers=[
+                            logging.FileHandler("main.log", encoding="utf-8"),
+                            logging.StreamHandler()
+                        ])
+    loglevel = logging.WARNING - verb*10
+    LOGGER.setLevel(loglevel)
+    main(**args)
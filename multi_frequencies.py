@@ -0,0 +1,173 @@
+import logging
+
+import numpy as np
+from scipy import constants
+
+from util import export_results, to_decibel
+from model import (lengths, path_difference, path_difference_from_lengths,
+                   distance_from_path_diff)
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _carrier_weights(freqs, weights=None):
+    freqs = np.atleast_1d(np.asarray(freqs, dtype=float))
+    if weights is None:
+        weights = np.ones_like(freqs)/len(freqs)
+    weights = np.atleast_1d(np.asarray(weights, dtype=float))
+    if weights.shape != freqs.shape:
+        raise ValueError("The number of power weights needs to match the number of carriers.")
+    return freqs, weights
+
+def rec_power_multi(distance, freqs, h_tx, h_rx, weights=None, G_los=1, G_ref=1,
+                    c=constants.c, power_tx=1):
+    # Total receive power of N parallel carriers with power split weights. The
+    # carriers are along a new last axis which is summed up.
+    freqs, weights = _carrier_weights(freqs, weights)
+    d_los, d_ref = lengths(distance, h_tx, h_rx)
+    _path_diff = np.expand_dims(path_difference_from_lengths(d_los, d_ref, h_tx, h_rx), -1)
+    d_los = np.expand_dims(d_los, -1)
+    d_ref = np.expand_dims(d_ref, -1)
+    omega = 2*np.pi*freqs
+    phi = omega/c*_path_diff
+    _factor = weights*(c/(2*omega))**2
+    # Same terms as in single_frequency.rec_power
+    _sqrt_g_los, _sqrt_g_ref = G_los**.5, G_ref**.5
+    _part1 = ((_sqrt_g_los*_path_diff + (_sqrt_g_los-_sqrt_g_ref)*d_los)/(d_los*d_ref))**2
+    _part2 = 4*_sqrt_g_los*_sqrt_g_ref/(d_los*d_ref) * np.sin(phi/2)**2
+    power_rx = power_tx*np.sum(_factor*(_part1+_part2), axis=-1)
+    return power_rx
+
+def _max_cos(phi_low, phi_high):
+    # Maximum of cos(phi) for phi in [phi_low, phi_high]
+    _contains_peak = 2*np.pi*np.ceil(phi_low/(2*np.pi)) <= phi_high
+    return np.where(_contains_peak, 1., np.maximum(np.cos(phi_low),
+                                                   np.cos(phi_high)))
+
+def bound_rec_power_multi_interval(d_low, d_high, freqs, h_tx, h_rx,
+                                   weights=None, G_los=1, G_ref=1,
+                                   c=constants.c, power_tx=1):
+    # Lower bound on rec_power_multi for all distances in [d_low, d_high]. The
+    # power terms 1/d^2 are bounded by their value at d_high, the interference
+    # term by the largest cosine over the phase range of each carrier.
+    freqs, weights = _carrier_weights(freqs, weights)
+    d_los_low, d_ref_low = lengths(d_low, h_tx, h_rx)
+    d_los_high, d_ref_high = lengths(d_high, h_tx, h_rx)
+    omega = 2*np.pi*freqs
+    _factor = weights*(c/(2*omega))**2
+    _phi_low = np.expand_dims(path_difference_from_lengths(
+        d_los_high, d_ref_high, h_tx, h_rx)/c, -1)*omega
+    _phi_high = np.expand_dims(path_difference_from_lengths(
+        d_los_low, d_ref_low, h_tx, h_rx)/c, -1)*omega
+    _interference = np.sum(_factor*_max_cos(_phi_low, _phi_high), axis=-1)
+    _scale_interference = np.where(_interference > 0, 1/(d_los_low*d_ref_low),
+                                   1/(d_los_high*d_ref_high))
+    _part12 = np.sum(_factor)*(G_los/d_los_high**2 + G_ref/d_ref_high**2)
+    _part3 = 2*np.sqrt(G_los*G_ref)*_scale_interference*_interference
+    return power_tx*(_part12 - _part3)
+
+def worst_case_rec_power_multi(d_min: float, d_max: float, freqs, h_tx: float,
+                               h_rx: float, weights=None, tol_db: float = 0.01,
+                               max_iter: int = 100, c=constants.c, **kwargs):
+    # Branch-and-bound search for the minimum of rec_power_multi over
+    # [d_min, d_max]. The initial intervals are spaced such that the phase of
+    # the highest carrier changes by at most pi in each of them. Intervals
+    # whose lower bound cannot improve the current minimum by more than tol_db
+    # are discarded, the others are split.
+    if d_max <= d_min:
+        raise ValueError("The maximum distance needs to be larger than the minimum distance.")
+    freqs, weights = _carrier_weights(freqs, weights)
+    _diff_dmin = path_difference(d_min, h_tx, h_rx)
+    _diff_dmax = path_difference(d_max, h_tx, h_rx)
+    num_intervals = int(np.ceil(2*np.max(freqs)*(_diff_dmin-_diff_dmax)/c)) + 1
+    edges = distance_from_path_diff(np.linspace(_diff_dmax, _diff_dmin,
+                                                num_intervals+1), h_tx, h_rx)
+    edges = np.clip(np.sort(edges), d_min, d_max)
+    edges[0], edges[-1] = d_min, d_max
+    d_low, d_high = edges[:-1], edges[1:]
+
+    _power = rec_power_multi(edges, freqs, h_tx, h_rx, weights=weights, c=c,
+                             **kwargs)
+    idx_min = np.argmin(_power)
+    power_min, d_worst = _power[idx_min], edges[idx_min]
+    _ratio = 10**(tol_db/10)
+    for _iter in range(max_iter):
+        _lower = bound_rec_power_multi_interval(d_low, d_high, freqs, h_tx,
+                                                h_rx, weights=weights, c=c,
+                                                **kwargs)
+        _active = _lower*_ratio < power_min
+        if not np.any(_active):
+            break
+        d_low, d_high = d_low[_active], d_high[_active]
+        d_mid = (d_low+d_high)/2
+        _power = rec_power_multi(d_mid, freqs, h_tx, h_rx, weights=weights,
+                                 c=c, **kwargs)
+        idx_min = np.argmin(_power)
+        if _power[idx_min] < power_min:
+            power_min, d_worst = _power[idx_min], d_mid[idx_min]
+        d_low, d_high = np.concatenate([d_low, d_mid]), np.concatenate([d_mid, d_high])
+    else:
+        LOGGER.warning(f"Worst-case search did not converge within {max_iter:d} iterations.")
+    LOGGER.debug(f"Worst-case search finished after {_iter:d} iterations.")
+    return power_min, d_worst
+
+
+def main(freqs, h_tx: float, h_rx: float, weights=None, d_min: float = 10.,
+         d_max: float = 100., c=constants.c, plot=False, export=False):
+    freqs, weights = _carrier_weights(freqs, weights)
+    distance = np.logspace(0, 3, 2000)
+    power = rec_power_multi(distance, freqs, h_tx, h_rx, weights=weights)
+    power_db = to_decibel(power)
+
+    power_min, d_worst = worst_case_rec_power_multi(d_min, d_max, freqs, h_tx,
+                                                    h_rx, weights=weights)
+    LOGGER.info(f"Worst-case receive power in [{d_min:.1f}, {d_max:.1f}]: {to_decibel(power_min):.2f} dB at d={d_worst:.3f} m")
+
+    results = {"distance": distance,
+               "power": power_db,
+              }
+
+    if plot:
+        import matplotlib.pyplot as plt
+        fig, axs = plt.subplots()
+        axs.semilogx(distance, power_db, label="Receive Power")
+        axs.semilogx(d_worst, to_decibel(power_min), 'o', label="Worst Case")
+        axs.set_xlabel("Distance $d$ [m]")
+        axs.set_ylabel("Receive Power ${P_r}$ [dB]")
+        axs.legend()
+
+    if export:
+        LOGGER.debug("Exporting multi-carrier power results.")
+        fname = f"power-multi-{freqs[0]:E}-N{len(freqs):d}-t{h_tx:.1f}-r{h_rx:.1f}.dat"
+        export_results(results, fname)
+    return {**results, "worstPower": to_decibel(power_min), "worstDistance": d_worst}
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", "--h_tx", type=float, default=10.)
+    parser.add_argument("-r", "--h_rx", type=float, default=1.5)
+    parser.add_argument("-f", "--freqs", type=float, nargs="+",
+                        default=[2.4e9, 2.5e9, 2.65e9])
+    parser.add_argument("-p", "--weights", type=float, nargs="+", default=None)
+    parser.add_argument("-dmin", "--d_min", type=float, default=10.)
+    parser.add_argument("-dmax", "--d_max", type=float, default=100.)
+    parser.add_argument("--plot", action="store_true")
+    parser.add_argument("--export", action="store_true")
+    parser.add_argument("-v", "--verbosity", action="count", default=0,
+                        help="Increase output verbosity")
+    args = vars(parser.parse_args())
+    verb = args.pop("verbosity")
+    logging.basicConfig(format="%(asctime)s - %(module)s -- [%(levelname)8s]: %(message)s",
+                        handlers=[
+                            logging.FileHandler("main.log", encoding="utf-8"),
+                            logging.StreamHandler()
+                        ])
+    loglevel = logging.WARNING - verb*10
+    LOGGER.setLevel(loglevel)
+    main(**args)
+    if args["plot"]:
+        import matplotlib.pyplot as plt
+        plt.show()
@@ -2,27 +2,44 @@ import logging
 
 import numpy as np
 from scipy import constants
-from scipy import optimize
-import matplotlib.pyplot as plt
 
-from single_frequency import rec_power, min_rec_power_single_freq, crit_dist
-from two_frequencies import sum_power_envelope, delta_freq_peak_approximation
+from model import lengths, path_difference_from_lengths
+from single_frequency import rec_power, min_rec_power_single_freq, crit_dist_k
+from two_frequencies import (sum_power_envelope, sum_power_envelope_grad,
+                             delta_freq_peak_approximation)
 from util import to_decibel, export_results
+from sampling import adaptive_distances
+from disk_cache import disk_cached
+from plotting import LivePlot
+from profiling import (profiled, stage, enable_profiling,
+                       is_profiling_enabled, format_summary, dump_trace)
 
 
 LOGGER = logging.getLogger(__name__)
 
 def sum_power_d1(delta_freq, freq, h_tx, h_rx, theta=0.5, c=constants.c, power_tx=1):
-    d1 = crit_dist(delta_freq, h_tx, h_rx, k=1)
+    d1 = crit_dist_k(1, delta_freq, h_tx, h_rx, c=c)
     return sum_power_envelope(d1, delta_freq, freq, h_tx, h_rx, theta=theta)
 
+def sum_power_d1_grad(delta_freq, freq, h_tx, h_rx, theta=0.5, c=constants.c,
+                      power_tx=1):
+    # sum_power_d1 and its total derivative with respect to delta_freq, which
+    # includes the shift of d_1. The path difference at d_1 is c/delta_freq.
+    d1 = crit_dist_k(1, delta_freq, h_tx, h_rx, c=c)
+    power, grad_distance, grad_delta_freq = sum_power_envelope_grad(
+            d1, delta_freq, freq, h_tx, h_rx, theta=theta)
+    d_los, d_ref = lengths(d1, h_tx, h_rx)
+    _d_path_diff = -d1*path_difference_from_lengths(d_los, d_ref, h_tx, h_rx)/(d_los*d_ref)
+    _d_d1 = -c/delta_freq**2/_d_path_diff
+    return power, grad_distance*_d_d1 + grad_delta_freq
 
-def find_optimal_delta_freq(d_min: float, d_max: float, freq: float, 
-                            h_tx: float, h_rx: float, theta: float = 0.5,
-                            c: float = constants.speed_of_light):
-    if d_max <= d_min:
-        raise ValueError("The maximum distance needs to be larger than the minimum distance.")
 
+def _delta_freq_problem(d_min, d_max, freq, h_tx, h_rx, theta=0.5):
+    # Branch of the optimization: "approximation" if there is no intersection
+    # between P_r(dmax) and g, otherwise "g_dmin" or "g_d1" depending on the
+    # function that determines g. Returns the branch, the bounds on log10(df),
+    # log(P_r(dmax))-log(g), whose root is the optimum, and a function that
+    # returns it together with its derivative with respect to log10(df).
     # Preparation
     _df_pi_dmin, _df_2pi_dmin = delta_freq_peak_approximation(d_min, h_tx, h_rx)
     _df_pi_dmax, _df_2pi_dmax = delta_freq_peak_approximation(d_max, h_tx, h_rx)
@@ -34,12 +51,11 @@ def find_optimal_delta_freq(d_min: float, d_max: float, freq: float,
     else:
         g_dmax_max = sum_power_envelope(d_min, _df_pi_dmax, freq, h_tx, h_rx,
                                         theta=theta)
-    
+
     # Branch 1: No intersection
     if power_dmax_max < g_dmax_max:
-        LOGGER.warn("No intersection between P_r(dmax) and g. Using approximation")
-        opt_df = _df_pi_dmax
-        return opt_df
+        _x = np.log10(_df_pi_dmax)
+        return "approximation", [_x, _x], None, None
 
     # Branch 2: Intersection
     power_dmax_dmin = sum_power_envelope(d_max, _df_2pi_dmin, freq, h_tx, h_rx,
@@ -47,39 +63,236 @@ def find_optimal_delta_freq(d_min: float, d_max: float, freq: float,
     power_dmin_min = sum_power_envelope(d_min, _df_2pi_dmin, freq, h_tx, h_rx,
                                         theta=theta)
     if power_dmax_dmin > power_dmin_min:
+        branch = "g_dmin"
         _bounds = [np.log10(_df_pi_dmin), np.log10(_df_2pi_dmin)]
         g_min = lambda x: sum_power_envelope(d_min, 10**x, freq, h_tx, h_rx,
                                              theta=theta)
+        g_min_grad = lambda x: sum_power_envelope_grad(
+                d_min, 10**x, freq, h_tx, h_rx, theta=theta)[::2]
     else:
+        branch = "g_d1"
         _bounds = [np.log10(_df_2pi_dmin), np.log10(_df_2pi_dmax)]
         g_min = lambda x: sum_power_d1(10**x, freq, h_tx, h_rx, theta=theta)
+        g_min_grad = lambda x: sum_power_d1_grad(10**x, freq, h_tx, h_rx,
+                                                 theta=theta)
     p_max = lambda x: sum_power_envelope(d_max, 10**x, freq, h_tx, h_rx,
                                          theta=theta)
-    func_opt = lambda x: np.abs(np.log(p_max(x))-np.log(g_min(x)))
-    opt = optimize.minimize(func_opt, x0=np.mean(_bounds),
-                            bounds=optimize.Bounds(*_bounds))
-    opt_df = 10**opt.x[0]
+    p_max_grad = lambda x: sum_power_envelope_grad(d_max, 10**x, freq, h_tx,
+                                                   h_rx, theta=theta)[::2]
+    func_root = lambda x: np.log(p_max(x))-np.log(g_min(x))
+
+    def func_root_grad(x):
+        _p, _grad_p = p_max_grad(x)
+        _g, _grad_g = g_min_grad(x)
+        return (np.log(_p)-np.log(_g),
+                np.log(10)*10**x*(_grad_p/_p - _grad_g/_g))
+    return branch, _bounds, func_root, func_root_grad
+
+def _solve_delta_freq_problem(bounds, func_root_grad, x0=None):
+    # Minimize |func_root| with its analytic gradient
+    if x0 is None or not bounds[0] <= x0 <= bounds[1]:
+        x0 = np.mean(bounds)
+
+    def func_opt(x):
+        _value, _grad = func_root_grad(x)
+        return np.abs(_value), np.sign(_value)*_grad
+    from scipy import optimize
+    with stage("scipy.optimize.minimize") as _stage:
+        opt = optimize.minimize(func_opt, x0=x0, jac=True,
+                                bounds=optimize.Bounds(*bounds))
+        _stage.add(nfev=opt.nfev, nit=opt.nit)
+    return 10**opt.x[0], opt.nfev
+
+@disk_cached
+@profiled()
+def find_optimal_delta_freq(d_min: float, d_max: float, freq: float, 
+                            h_tx: float, h_rx: float, theta: float = 0.5,
+                            c: float = constants.speed_of_light, x0=None):
+    # x0 is an optional start value of df for the optimizer, e.g., the optimum
+    # of a neighboring scenario.
+    if d_max <= d_min:
+        raise ValueError("The maximum distance needs to be larger than the minimum distance.")
+    branch, _bounds, _func_root, func_root_grad = _delta_freq_problem(
+            d_min, d_max, freq, h_tx, h_rx, theta=theta)
+    if branch == "approximation":
+        LOGGER.warn("No intersection between P_r(dmax) and g. Using approximation")
+        opt_df = 10**_bounds[0]
+        return opt_df
+    opt_df, _nfev = _solve_delta_freq_problem(
+            _bounds, func_root_grad, x0=None if x0 is None else np.log10(x0))
     return opt_df
 
+@profiled()
+def find_optimal_delta_freq_path(d_min, d_max, freq, h_tx, h_rx, theta=0.5,
+                                 c: float = constants.speed_of_light,
+                                 max_step: float = 0.05):
+    # Continuation along an ordered sequence of scenarios (broadcast arguments),
+    # e.g., a smoothly increasing d_max. The root of the objective is searched
+    # within +-max_step (in log10(df)) around the previous optimum with Brent's
+    # method. A full solve is only done if the branch of the problem switches
+    # or the root is not bracketed by this window.
+    from scipy import optimize
+    params = np.broadcast_arrays(d_min, d_max, freq, h_tx, h_rx, theta)
+    if np.any(params[1] <= params[0]):
+        raise ValueError("The maximum distance needs to be larger than the minimum distance.")
+    opt_df = np.empty(params[0].shape)
+    branches = []
+    _x_prev = None
+    _num_evaluations = 0
+    for idx in np.ndindex(opt_df.shape):
+        _d_min, _d_max, _freq, _h_tx, _h_rx, _theta = [p[idx] for p in params]
+        branch, _bounds, func_root, func_root_grad = _delta_freq_problem(
+                _d_min, _d_max, _freq, _h_tx, _h_rx, theta=_theta)
+        if branches and branch != branches[-1]:
+            LOGGER.debug(f"Branch switch from '{branches[-1]}' to '{branch}' at step {len(branches):d}.")
+            _x_prev = None
+        if branch == "approximation":
+            opt_df[idx] = 10**_bounds[0]
+            _x_prev = None
+        else:
+            _nfev = 0
+            if _x_prev is not None:
+                _window = [max(_bounds[0], _x_prev-max_step),
+                           min(_bounds[1], _x_prev+max_step)]
+                _f_window = [func_root(_x) for _x in _window]
+                _nfev = 2
+                if np.sign(_f_window[0]) != np.sign(_f_window[1]):
+                    with stage("scipy.optimize.brentq") as _stage:
+                        _x, _result = optimize.brentq(func_root, *_window,
+                                                      xtol=1e-12,
+                                                      full_output=True)
+                        _stage.add(nfev=_result.function_calls,
+                                   nit=_result.iterations)
+                    opt_df[idx] = 10**_x
+                    _nfev += _result.function_calls
+                else:
+                    LOGGER.debug(f"Optimum left the window at step {len(branches):d}.")
+                    _x_prev = None
+            if _x_prev is None:
+                opt_df[idx], _nfev_full = _solve_delta_freq_problem(
+                        _bounds, func_root_grad)
+                _nfev += _nfev_full
+            _num_evaluations += _nfev
+            _x_prev = np.log10(opt_df[idx])
+        branches.append(branch)
+    LOGGER.debug(f"Path with {len(branches):d} steps solved with {_num_evaluations:d} function evaluations.")
+    return opt_df[()], branches
+
+@profiled()
+def find_optimal_delta_freq_batch(d_min, d_max, freq, h_tx, h_rx, theta=0.5,
+                                  c: float = constants.speed_of_light,
+                                  xtol: float = 1e-12, max_iter: int = 100,
+                                  num_samples: int = 16, ftol: float = 1e-9):
+    d_min, d_max, freq, h_tx, h_rx, theta = np.broadcast_arrays(
+            d_min, d_max, freq, h_tx, h_rx, theta)
+    if np.any(d_max <= d_min):
+        raise ValueError("The maximum distance needs to be larger than the minimum distance.")
+
+    # Preparation
+    _df_pi_dmin, _df_2pi_dmin = delta_freq_peak_approximation(d_min, h_tx, h_rx)
+    _df_pi_dmax, _df_2pi_dmax = delta_freq_peak_approximation(d_max, h_tx, h_rx)
+
+    power_dmax_max = sum_power_envelope(d_max, _df_pi_dmax, freq, h_tx, h_rx,
+                                        theta=theta)
+    g_dmax_max = np.where(_df_pi_dmax > _df_2pi_dmin,
+                          sum_power_d1(_df_pi_dmax, freq, h_tx, h_rx, theta=theta),
+                          sum_power_envelope(d_min, _df_pi_dmax, freq, h_tx,
+                                             h_rx, theta=theta))
+    # Branch 1: No intersection
+    no_intersection = power_dmax_max < g_dmax_max
+    LOGGER.debug(f"No intersection for {np.count_nonzero(no_intersection):d} "
+                 f"out of {no_intersection.size:d} scenarios.")
+
+    # Branch 2: Intersection
+    power_dmax_dmin = sum_power_envelope(d_max, _df_2pi_dmin, freq, h_tx, h_rx,
+                                         theta=theta)
+    power_dmin_min = sum_power_envelope(d_min, _df_2pi_dmin, freq, h_tx, h_rx,
+                                        theta=theta)
+    use_g_dmin = power_dmax_dmin > power_dmin_min
+    lower = np.log10(np.where(use_g_dmin, _df_pi_dmin, _df_2pi_dmin))
+    upper = np.log10(np.where(use_g_dmin, _df_2pi_dmin, _df_2pi_dmax))
+
+    def func_root(x):
+        _df = 10**x
+        g_min = np.where(use_g_dmin,
+                         sum_power_envelope(d_min, _df, freq, h_tx, h_rx,
+                                            theta=theta),
+                         sum_power_d1(_df, freq, h_tx, h_rx, theta=theta))
+        p_max = sum_power_envelope(d_max, _df, freq, h_tx, h_rx, theta=theta)
+        return np.log(p_max) - np.log(g_min)
+
+    # The objective is not monotone and vanishes at the upper bound of the
+    # g_d1 branch (d_1 = d_max), so the root is bracketed on a grid of
+    # num_samples points. Values below ftol at the bounds are not roots. The
+    # first sign change from the lower bound is used.
+    _t = np.linspace(0, 1, num_samples).reshape((-1,)+(1,)*lower.ndim)
+    x_grid = lower + _t*(upper-lower)
+    f_grid = func_root(x_grid)
+    valid = np.isfinite(f_grid)
+    valid[[0, -1]] &= np.abs(f_grid[[0, -1]]) >= ftol
+    sign_change = (valid[:-1] & valid[1:]
+                   & (np.sign(f_grid[:-1]) != np.sign(f_grid[1:])))
+    bracketed = np.any(sign_change, axis=0)
+    idx = np.argmax(sign_change, axis=0)
+    # Without a sign change, the best point is the sample closest to a root
+    idx_boundary = np.argmin(np.where(valid, np.abs(f_grid), np.inf), axis=0)
+    x_boundary = np.take_along_axis(x_grid, idx_boundary[None], axis=0)[0]
+    lower = np.take_along_axis(x_grid, idx[None], axis=0)[0]
+    upper = np.take_along_axis(x_grid, idx[None]+1, axis=0)[0]
+    f_lower = np.take_along_axis(f_grid, idx[None], axis=0)[0]
+
+    # Simultaneous bisection on log10(df) for all scenarios
+    _iter = 0
+    with stage("bisection", num_elements=lower.size) as _stage:
+        for _iter in range(max_iter):
+            if np.all(upper-lower < xtol):
+                break
+            mid = (lower+upper)/2
+            f_mid = func_root(mid)
+            move_lower = np.sign(f_mid) == np.sign(f_lower)
+            lower = np.where(move_lower, mid, lower)
+            f_lower = np.where(move_lower, f_mid, f_lower)
+            upper = np.where(move_lower, upper, mid)
+        _stage.add(nit=_iter)
+    LOGGER.debug(f"Bisection finished after {_iter:d} iterations.")
+    opt_x = np.where(bracketed, (lower+upper)/2, x_boundary)
+    opt_df = np.where(no_intersection, _df_pi_dmax, 10**opt_x)
+    return opt_df[()]
+
+def _log_results(results):
+    LOGGER.info(f"Optimal frequency spacing: {results['optDf']:E}")
+    LOGGER.info(f"Minimum power single frequency: {results['minPowerSingle']:.2f} dB")
+    LOGGER.info(f"Minimum power two frequencies: {results['minPowerTwo']:.2f} dB")
+
+@disk_cached(on_hit=_log_results)
 def main_optimal_frequency_distance(d_min: float, d_max: float, freq: float, 
                                     h_tx: float, h_rx: float,
                                     c: float = constants.speed_of_light,
-                                    plot=False, export=False):
+                                    plot=False, export=False, adaptive=False,
+                                    plotter=None):
+
+    opt_df = find_optimal_delta_freq(d_min, d_max, freq, h_tx, h_rx, c)
 
-    distance = np.logspace(np.log10(d_min)-.1, np.log10(d_max)+.1, 3000)
+    if adaptive:
+        _func = lambda d: np.stack([
+            rec_power(d, freq, h_tx, h_rx),
+            .5*(rec_power(d, freq, h_tx, h_rx) + rec_power(d, freq+opt_df, h_tx, h_rx))])
+        distance, _ = adaptive_distances(_func, 10**(np.log10(d_min)-.1),
+                                         10**(np.log10(d_max)+.1),
+                                         [freq, freq+opt_df, opt_df], h_tx,
+                                         h_rx, c=c)
+        LOGGER.info(f"Adaptive sampling with {len(distance):d} distances.")
+    else:
+        distance = np.logspace(np.log10(d_min)-.1, np.log10(d_max)+.1, 3000)
     power_rx_single = rec_power(distance, freq, h_tx, h_rx)
     power_rx_single_db = to_decibel(power_rx_single)
     min_power_single = min_rec_power_single_freq(d_min, d_max, freq, h_tx, h_rx)
     min_power_single_db = to_decibel(min_power_single)
-    LOGGER.info(f"Minimum power single frequency: {min_power_single_db:.2f} dB")
 
-    opt_df = find_optimal_delta_freq(d_min, d_max, freq, h_tx, h_rx, c)
-    LOGGER.info(f"Optimal frequency spacing: {opt_df:E}")
     power_rx_opt = sum_power_envelope(distance, opt_df, freq, h_tx, h_rx)
     power_rx_opt_db = to_decibel(power_rx_opt)
     min_power_two = sum_power_envelope(d_max, opt_df, freq, h_tx, h_rx)
     min_power_two_db = to_decibel(min_power_two)
-    LOGGER.info(f"Minimum power two frequencies: {min_power_two_db:.2f} dB")
 
     power_rx_opt_exact = .5*(power_rx_single + rec_power(distance, freq+opt_df, h_tx, h_rx))
     power_rx_opt_exact_db = to_decibel(power_rx_opt_exact)
@@ -89,16 +302,22 @@ def main_optimal_frequency_distance(d_min: float, d_max: float, freq: float,
                "powerOptExact": power_rx_opt_exact_db}
 
     if plot:
-        fig, axs = plt.subplots()
-        axs.semilogx(distance, power_rx_single_db, '-b', label="Single Frequency")
-        axs.semilogx(distance, power_rx_opt_db, '-r', label="Lower Bound")
-        axs.semilogx(distance, power_rx_opt_exact_db, '--r', alpha=.5, label="Two Freq. - Optimal$\Delta f$")
-        axs.set_xlabel("Distance $d$ [m]")
-        axs.set_ylabel("Receive Power $P_r$ [dB]")
-        axs.set_title(f"Parameters: $f_1=${freq:E} Hz,\n$h_{{tx}}={h_tx:.1f}$ m, $h_{{rx}}={h_rx:1f}$ m,\n$d_{{min}}={d_min:.1f}$ m, $d_{{max}}={d_max:.1f}$ m")
+        if plotter is None:
+            plotter = LivePlot()
+        plotter.update("single", distance, power_rx_single_db, '-b', label="Single Frequency")
+        plotter.update("lower", distance, power_rx_opt_db, '-r', label="Lower Bound")
+        plotter.update("exact", distance, power_rx_opt_exact_db, '--r', alpha=.5, label="Two Freq. - Optimal$\Delta f$")
+        plotter.axs.set_xlabel("Distance $d$ [m]")
+        plotter.axs.set_ylabel("Receive Power $P_r$ [dB]")
+        plotter.axs.set_title(f"Parameters: $f_1=${freq:E} Hz,\n$h_{{tx}}={h_tx:.1f}$ m, $h_{{rx}}={h_rx:1f}$ m,\n$d_{{min}}={d_min:.1f}$ m, $d_{{max}}={d_max:.1f}$ m")
+        plotter.draw()
     if export:
         LOGGER.debug("Exporting results.")
         export_results(results, f"power_opt_freq-{freq:E}-t{h_tx:.1f}-r{h_rx:.1f}-dmin{d_min:.1f}-dmax{d_max:.1f}.dat")
+    results = {**results, "optDf": opt_df, "minPowerSingle": min_power_single_db,
+               "minPowerTwo": min_power_two_db}
+    _log_results(results)
+    return results
 
 if __name__ == "__main__":
     import argparse
@@ -110,10 +329,15 @@ if __name__ == "__main__":
     parser.add_argument("-dmax", "--d_max", type=float, default=100.)
     parser.add_argument("--plot", action="store_true")
     parser.add_argument("--export", action="store_true")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Place the distances adaptively around the nulls")
+    parser.add_argument("--trace", default=None,
+                        help="Write a Chrome trace (JSON) of the profiled stages to this file")
     parser.add_argument("-v", "--verbosity", action="count", default=0,
                         help="Increase output verbosity")
     args = vars(parser.parse_args())
     verb = args.pop("verbosity")
+    trace = args.pop("trace")
     logging.basicConfig(format="%(asctime)s - %(module)s -- [%(levelname)8s]: %(message)s",
                         handlers=[
                             logging.FileHandler("main.log", encoding="utf-8"),
@@ -121,5 +345,13 @@ if __name__ == "__main__":
                         ])
     loglevel = logging.WARNING - verb*10
     LOGGER.setLevel(loglevel)
+    if verb >= 2 or trace is not None:
+        enable_profiling(trace=trace is not None)
     main_optimal_frequency_distance(**args)
-    plt.show()
+    if is_profiling_enabled():
+        LOGGER.info(f"Profiling summary:\n{format_summary()}")
+        if trace is not None:
+            dump_trace(trace)
+    if args["plot"]:
+        import matplotlib.pyplot as plt
+        plt.show()
@@ -0,0 +1,57 @@
+import numpy as np
+
+
+def decimate_minmax(x, y, num_bins: int, log_x=False):
+    # Reduce a curve with sorted x to at most 2*num_bins points. Each bin keeps
+    # the points of its minimum and maximum (in their original order), so that
+    # narrow nulls and peaks stay visible.
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(x) <= 2*num_bins:
+        return x, y
+    _x = np.log10(x) if log_x else x
+    edges = np.linspace(_x[0], _x[-1], num_bins+1)
+    bins = np.clip(np.searchsorted(edges, _x, side="right")-1, 0, num_bins-1)
+    order = np.lexsort((y, bins))
+    _bins_sorted = bins[order]
+    starts = np.flatnonzero(np.diff(_bins_sorted, prepend=-1))
+    ends = np.append(starts[1:], len(order)) - 1
+    idx = np.unique(np.concatenate([order[starts], order[ends]]))
+    return x[idx], y[idx]
+
+
+class LivePlot:
+    # Persistent figure with one line per curve name. Repeated calls, e.g.,
+    # from interactive widgets, only replace the data of the existing lines.
+    # Curves are decimated to the width of the axes in pixels.
+    def __init__(self, axs=None, xscale="log", yscale="linear",
+                 num_points=None):
+        if axs is None:
+            import matplotlib.pyplot as plt
+            fig, axs = plt.subplots()
+        self.axs = axs
+        self.axs.set_xscale(xscale)
+        self.axs.set_yscale(yscale)
+        self.num_points = num_points
+        self.lines = {}
+
+    def _num_bins(self):
+        if self.num_points is not None:
+            return max(self.num_points//2, 1)
+        return max(int(self.axs.get_window_extent().width), 1)
+
+    def update(self, name, x, y, *fmt, **kwargs):
+        _x, _y = decimate_minmax(x, y, self._num_bins(),
+                                 log_x=self.axs.get_xscale() == "log")
+        if name in self.lines:
+            self.lines[name].set_data(_x, _y)
+        else:
+            self.lines[name], = self.axs.plot(_x, _y, *fmt, **kwargs)
+        return self.lines[name]
+
+    def draw(self, legend=False):
+        self.axs.relim()
+        self.axs.autoscale_view()
+        if legend and self.axs.get_legend() is None:
+            self.axs.legend()
+        self.axs.figure.canvas.draw_idle()
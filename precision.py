@@ -0,0 +1,67 @@
+import contextlib
+import logging
+import numbers
+
+import numpy as np
+
+from util import to_decibel
+
+
+LOGGER = logging.getLogger(__name__)
+
+DTYPES = {"float64": np.dtype(np.float64), "float32": np.dtype(np.float32)}
+
+_compute_dtype = DTYPES["float64"]
+
+
+def get_dtype():
+    return _compute_dtype
+
+def set_dtype(dtype):
+    global _compute_dtype
+    dtype = np.dtype(dtype)
+    if dtype not in DTYPES.values():
+        raise ValueError(f"Unsupported dtype '{dtype}'. Supported are: {', '.join(DTYPES)}")
+    _compute_dtype = dtype
+
+@contextlib.contextmanager
+def use_dtype(dtype):
+    _previous = get_dtype()
+    set_dtype(dtype)
+    try:
+        yield
+    finally:
+        set_dtype(_previous)
+
+def as_compute_dtype(*values):
+    # Cast numeric inputs of the kernels to the selected dtype. Other inputs,
+    # e.g., a model.Geometry, are passed through.
+    if _compute_dtype == DTYPES["float64"]:
+        return values
+    return tuple(np.asarray(v, dtype=_compute_dtype)
+                 if isinstance(v, (np.ndarray, numbers.Number)) else v
+                 for v in values)
+
+def complex_dtype():
+    return np.result_type(_compute_dtype, np.complex64)
+
+def check_precision(func, *args, dtype="float32", num_samples: int = 1000,
+                    tol_db: float = 0.01, seed=None, **kwargs):
+    # Compare func in reduced precision against float64 on a random subset of
+    # the broadcast array arguments. Returns the largest deviation in dB.
+    _array_args = [isinstance(a, np.ndarray) and a.ndim > 0 for a in args]
+    _broadcast = np.broadcast_arrays(*[a for a, _is_arr in zip(args, _array_args) if _is_arr])
+    if _broadcast:
+        _size = _broadcast[0].size
+        rng = np.random.default_rng(seed)
+        idx = rng.choice(_size, size=min(num_samples, _size), replace=False)
+        _samples = iter([np.ravel(a)[idx] for a in _broadcast])
+        args = [next(_samples) if _is_arr else a for a, _is_arr in zip(args, _array_args)]
+    with use_dtype("float64"):
+        reference = to_decibel(func(*args, **kwargs))
+    with use_dtype(dtype):
+        reduced = to_decibel(func(*args, **kwargs))
+    error_db = float(np.nanmax(np.abs(reduced.astype(float) - reference)))
+    if error_db > tol_db:
+        LOGGER.warning(f"Reduced precision ({dtype}) deviates by {error_db:.3g} dB from float64 for {func.__name__}.")
+    return error_db
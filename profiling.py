@@ -0,0 +1,141 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+
+
+StageInfo = namedtuple("StageInfo", ["calls", "total_time", "max_time",
+                                     "num_elements", "counters"])
+
+_STAGES = {}
+_TRACE = []
+_enabled = False
+_trace_enabled = False
+
+
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+        self.clear()
+
+    def clear(self):
+        self.calls = 0
+        self.total_time = 0.
+        self.max_time = 0.
+        self.num_elements = 0
+        self.counters = {}
+
+    def record(self, start, stop, num_elements=0, **counters):
+        _duration = stop - start
+        self.calls += 1
+        self.total_time += _duration
+        self.max_time = max(self.max_time, _duration)
+        self.num_elements += num_elements
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+        if _trace_enabled:
+            _TRACE.append({"name": self.name, "ph": "X", "ts": start*1e6,
+                           "dur": _duration*1e6, "pid": os.getpid(),
+                           "tid": threading.get_ident(),
+                           "args": {"num_elements": num_elements, **counters}})
+
+    def info(self):
+        return StageInfo(self.calls, self.total_time, self.max_time,
+                         self.num_elements, dict(self.counters))
+
+
+class _StageContext:
+    # Handle of a running stage to add counters, e.g., the number of function
+    # evaluations of an optimizer.
+    def __init__(self, num_elements=0):
+        self.num_elements = num_elements
+        self.counters = {}
+
+    def add(self, **counters):
+        for key, value in counters.items():
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+def _get_stage(name):
+    if name not in _STAGES:
+        _STAGES[name] = _Stage(name)
+    return _STAGES[name]
+
+def _num_elements(values):
+    return sum(np.size(v) for v in values if isinstance(v, np.ndarray))
+
+def enable_profiling(trace: bool = False):
+    global _enabled, _trace_enabled
+    _enabled = True
+    _trace_enabled = trace
+
+def disable_profiling():
+    global _enabled, _trace_enabled
+    _enabled = _trace_enabled = False
+
+def is_profiling_enabled():
+    return _enabled
+
+@contextlib.contextmanager
+def stage(name: str, num_elements: int = 0):
+    if not _enabled:
+        yield _StageContext(num_elements)
+        return
+    _context = _StageContext(num_elements)
+    _start = time.perf_counter()
+    try:
+        yield _context
+    finally:
+        _get_stage(name).record(_start, time.perf_counter(),
+                                _context.num_elements, **_context.counters)
+
+def profiled(name=None):
+    # Records calls, wall time and the number of array elements of the
+    # arguments of the decorated function while profiling is enabled.
+    def decorator(func):
+        _name = name or f"{func.__module__}.{func.__qualname__}"
+        _get_stage(_name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            _start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                _get_stage(_name).record(
+                        _start, time.perf_counter(),
+                        _num_elements(args) + _num_elements(kwargs.values()))
+        return wrapper
+    return decorator
+
+def profiling_statistics():
+    return {name: _stage.info() for name, _stage in _STAGES.items()
+            if _stage.calls > 0}
+
+def clear_profiling():
+    for _stage in _STAGES.values():
+        _stage.clear()
+    _TRACE.clear()
+
+def format_summary():
+    # Table of the profiled stages sorted by their total (inclusive) time
+    lines = [f"{'Stage':<55} {'Calls':>8} {'Total [s]':>10} {'Max [s]':>10} {'Elements':>12}  Counters"]
+    _stats = sorted(profiling_statistics().items(),
+                    key=lambda item: item[1].total_time, reverse=True)
+    for name, info in _stats:
+        _counters = ", ".join(f"{k}={v}" for k, v in info.counters.items())
+        lines.append(f"{name:<55} {info.calls:>8d} {info.total_time:>10.4f} "
+                     f"{info.max_time:>10.4f} {info.num_elements:>12d}  {_counters}")
+    return "\n".join(lines)
+
+def dump_trace(filename: str):
+    # Chrome trace event format, e.g., for chrome://tracing or Perfetto
+    with open(filename, "w") as _file:
+        json.dump({"traceEvents": _TRACE, "displayTimeUnit": "ms"}, _file)
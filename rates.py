@@ -1,10 +1,10 @@
 import logging
 
 import numpy as np
-import matplotlib.pyplot as plt
 
 from util import export_results, to_decibel, achievable_rate
 from two_frequencies import power_eve
+from disk_cache import disk_cached
 
 LOGGER = logging.getLogger(__name__)
 
@@ -15,6 +15,7 @@ def worst_case_rate_eve(d_min_eve: float, freq: float, bw: float, h_tx: float,
     return _rate_eve
 
 
+@disk_cached
 def main(d_min_eve: float, freq: float, bw: float, h_tx: float, h_rx: float,
          plot=False, export=False, axs=None):
     df = np.logspace(5, 9, 1000)
@@ -33,6 +34,7 @@ def main(d_min_eve: float, freq: float, bw: float, h_tx: float, h_rx: float,
 
     if plot:
         if axs is None:
+            import matplotlib.pyplot as plt
             fig, axs = plt.subplots()
         axs.loglog(df, rate_eve, label=f"$f_1=${freq:E} - $R_E$")
         axs.loglog(df, rate_eve_lower, label=f"$f_1=${freq:E} - Approx.")
@@ -41,6 +43,7 @@ def main(d_min_eve: float, freq: float, bw: float, h_tx: float, h_rx: float,
         LOGGER.debug("Exporting single frequency power results.")
         fname = f"rate-eve-{freq:E}-bw{bw:E}-dmin{d_min_eve:.1f}-t{h_tx:.1f}-r{h_rx:.1f}.dat"
         export_results(results, fname)
+    return results
 
 if __name__ == "__main__":
     import argparse
@@ -64,11 +67,15 @@ if __name__ == "__main__":
                         ])
     loglevel = logging.WARNING - verb*10
     LOGGER.setLevel(loglevel)
-    fig, axs = plt.subplots()
+    axs = None
+    if args["plot"]:
+        import matplotlib.pyplot as plt
+        fig, axs = plt.subplots()
     freqlist = args.pop("freq")
     for freq in freqlist:
         main(freq=freq, **args, axs=axs)
-    axs.set_xlabel("Frequency Spacing $\\Delta f$ [Hz]")
-    axs.set_ylabel("Achievable Rate [bit/s]")
-    axs.legend()
-    plt.show()
+    if args["plot"]:
+        axs.set_xlabel("Frequency Spacing $\\Delta f$ [Hz]")
+        axs.set_ylabel("Achievable Rate [bit/s]")
+        axs.legend()
+        plt.show()
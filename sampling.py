@@ -0,0 +1,81 @@
+import logging
+
+import numpy as np
+from scipy import constants
+
+from model import path_difference, distance_from_path_diff
+from util import to_decibel
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def phase_distances(d_min, d_max, freqs, h_tx, h_rx, points_per_period=8,
+                    c=constants.c):
+    # Distances at which the phase omega/c*(d_ref-d_los) of each frequency is a
+    # multiple of 2*pi/points_per_period. These include all critical distances
+    # (nulls) in [d_min, d_max].
+    _diff_dmin = path_difference(d_min, h_tx, h_rx)
+    _diff_dmax = path_difference(d_max, h_tx, h_rx)
+    distance = [np.array([d_min, d_max], dtype=float)]
+    for freq in np.atleast_1d(freqs):
+        _step = c/(freq*points_per_period)
+        _j = np.arange(np.ceil(_diff_dmax/_step), np.floor(_diff_dmin/_step)+1)
+        if len(_j) > 0:
+            distance.append(distance_from_path_diff(_j*_step, h_tx, h_rx))
+    distance = np.unique(np.concatenate(distance))
+    return distance[(distance >= d_min) & (distance <= d_max)]
+
+def adaptive_distances(func, d_min, d_max, freqs, h_tx, h_rx, tol_db=0.1,
+                       points_per_period=8, num_base=50, max_points=200000,
+                       c=constants.c):
+    # Adaptive sampling of func(distance) [linear power, distance along the
+    # last axis] on [d_min, d_max]. The initial points are phase_distances of
+    # freqs and a coarse log grid for the regime without nulls. Intervals are
+    # bisected (in log distance) as long as the midpoint deviates by more than
+    # tol_db from the interpolation of its neighbors. Finally, the points
+    # around the smallest sample are refined until both neighbors are within
+    # tol_db of it.
+    distance = np.union1d(phase_distances(d_min, d_max, freqs, h_tx, h_rx,
+                                          points_per_period=points_per_period,
+                                          c=c),
+                          np.logspace(np.log10(d_min), np.log10(d_max), num_base))
+    values = to_decibel(func(distance))
+    active = np.ones(len(distance)-1, dtype=bool)
+    _iter = 0
+    while np.any(active):
+        _iter += 1
+        idx = np.flatnonzero(active)
+        if len(distance) + len(idx) > max_points:
+            LOGGER.warning(f"Reached the maximum number of {max_points:d} points before the tolerance of {tol_db} dB.")
+            break
+        _mid = np.sqrt(distance[idx]*distance[idx+1])
+        _values_mid = to_decibel(func(_mid))
+        _error = np.abs(_values_mid - (values[..., idx]+values[..., idx+1])/2)
+        _error = np.reshape(_error, (-1, len(idx))).max(axis=0)
+        refine = np.zeros_like(active)
+        refine[idx] = _error > tol_db
+        distance = np.insert(distance, idx[refine[idx]]+1, _mid[refine[idx]])
+        values = np.insert(values, idx[refine[idx]]+1,
+                           _values_mid[..., refine[idx]], axis=-1)
+        active = np.repeat(refine, 1+refine)
+    LOGGER.debug(f"Adaptive refinement finished after {_iter:d} iterations with {len(distance):d} points.")
+
+    # Refinement around the minimum of each curve
+    for _iter in range(100):
+        _values = np.reshape(values, (-1, len(distance)))
+        _idx_min = np.argmin(_values, axis=-1)
+        _left = np.maximum(_idx_min-1, 0)
+        _right = np.minimum(_idx_min+1, len(distance)-1)
+        _rows = np.arange(len(_idx_min))
+        _diff_left = _values[_rows, _left] - _values[_rows, _idx_min]
+        _diff_right = _values[_rows, _right] - _values[_rows, _idx_min]
+        _refine = np.concatenate([_left[_diff_left > tol_db],
+                                  _idx_min[_diff_right > tol_db]])
+        _refine = np.unique(_refine)
+        if len(_refine) == 0:
+            break
+        _mid = np.sqrt(distance[_refine]*distance[_refine+1])
+        values = np.insert(values, _refine+1, to_decibel(func(_mid)), axis=-1)
+        distance = np.insert(distance, _refine+1, _mid)
+    return distance, values
@@ -0,0 +1,124 @@
+import logging
+
+import numpy as np
+
+from two_frequencies import bound_rec_power_two_freq
+from rates import worst_case_rate_eve
+from optimal_frequency_distance import find_optimal_delta_freq
+from util import achievable_rate
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _delta_freq_grid(freq, num_steps):
+    return np.logspace(7, np.log10(freq), num_steps)
+
+def _power_bob(d_min_bob, d_max_bob, freq, h_tx, h_rx_bob, theta, delta_freq):
+    return bound_rec_power_two_freq(d_min_bob, d_max_bob, delta_freq, freq,
+                                    h_tx, h_rx_bob, bound="lower", theta=theta)
+
+def _opt_df(d_min_bob, d_max_bob, freq, h_tx, h_rx_bob, theta):
+    return find_optimal_delta_freq(d_min_bob, d_max_bob, freq, h_tx, h_rx_bob,
+                                   theta=theta)
+
+def _power_bob_opt_df(d_min_bob, d_max_bob, freq, h_tx, h_rx_bob, theta, opt_df):
+    return _power_bob(d_min_bob, d_max_bob, freq, h_tx, h_rx_bob, theta, opt_df)
+
+def _rate_bob(bw, power_bob):
+    return achievable_rate(power_bob, bw)
+
+def _rate_bob_opt_df(bw, power_bob_opt_df):
+    return achievable_rate(power_bob_opt_df, bw)
+
+def _rate_eve(d_min_eve, freq, bw, h_tx, h_rx_eve):
+    return worst_case_rate_eve(d_min_eve, freq, bw, h_tx, h_rx_eve)
+
+def _sec_rate(rate_bob, rate_eve):
+    return np.maximum(rate_bob-rate_eve, 0)
+
+def _sec_rate_opt_df(rate_bob_opt_df, rate_eve):
+    return np.maximum(rate_bob_opt_df-rate_eve, 0)
+
+# Stage name: (function, scenario parameters, upstream stages)
+STAGES = {
+        "delta_freq": (_delta_freq_grid, ("freq", "num_steps"), ()),
+        "power_bob": (_power_bob, ("d_min_bob", "d_max_bob", "freq", "h_tx",
+                                   "h_rx_bob", "theta"), ("delta_freq",)),
+        "opt_df": (_opt_df, ("d_min_bob", "d_max_bob", "freq", "h_tx",
+                             "h_rx_bob", "theta"), ()),
+        "power_bob_opt_df": (_power_bob_opt_df, ("d_min_bob", "d_max_bob",
+                                                 "freq", "h_tx", "h_rx_bob",
+                                                 "theta"), ("opt_df",)),
+        "rate_bob": (_rate_bob, ("bw",), ("power_bob",)),
+        "rate_bob_opt_df": (_rate_bob_opt_df, ("bw",), ("power_bob_opt_df",)),
+        "rate_eve": (_rate_eve, ("d_min_eve", "freq", "bw", "h_tx",
+                                 "h_rx_eve"), ()),
+        "sec_rate": (_sec_rate, (), ("rate_bob", "rate_eve")),
+        "sec_rate_opt_df": (_sec_rate_opt_df, (), ("rate_bob_opt_df",
+                                                   "rate_eve")),
+        }
+
+
+class Scenario:
+    # Secrecy rate scenario of secrecy_rate.main with lazy evaluation. Every
+    # stage is computed on first access and cached. Updating parameters only
+    # invalidates the stages that depend on them, directly or through their
+    # upstream stages.
+    def __init__(self, d_min_bob: float, d_max_bob: float, d_min_eve: float,
+                 freq: float, bw: float, h_tx: float, h_rx_bob: float,
+                 h_rx_eve: float, theta: float = 0.5, num_steps: int = 2000):
+        self._params = {"d_min_bob": d_min_bob, "d_max_bob": d_max_bob,
+                        "d_min_eve": d_min_eve, "freq": freq, "bw": bw,
+                        "h_tx": h_tx, "h_rx_bob": h_rx_bob,
+                        "h_rx_eve": h_rx_eve, "theta": theta,
+                        "num_steps": num_steps}
+        self._values = {}
+        self.num_evaluations = dict.fromkeys(STAGES, 0)
+
+    @property
+    def parameters(self):
+        return dict(self._params)
+
+    def __getattr__(self, name):
+        if name in STAGES:
+            return self.get(name)
+        if not name.startswith("_") and name in self._params:
+            return self._params[name]
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def get(self, stage: str):
+        if stage not in self._values:
+            func, params, upstream = STAGES[stage]
+            kwargs = {p: self._params[p] for p in params}
+            kwargs.update({s: self.get(s) for s in upstream})
+            LOGGER.debug(f"Computing stage '{stage}'.")
+            self._values[stage] = func(**kwargs)
+            self.num_evaluations[stage] += 1
+        return self._values[stage]
+
+    def update(self, **params):
+        unknown = set(params) - set(self._params)
+        if unknown:
+            raise ValueError(f"Unknown scenario parameters: {', '.join(sorted(unknown))}")
+        changed = {k for k, v in params.items()
+                   if not np.array_equal(self._params[k], v)}
+        self._params.update(params)
+        invalid = {s for s, (_, p, _) in STAGES.items() if changed.intersection(p)}
+        # Propagate to all downstream stages
+        _num_invalid = 0
+        while len(invalid) != _num_invalid:
+            _num_invalid = len(invalid)
+            invalid.update(s for s, (_, _, u) in STAGES.items()
+                           if invalid.intersection(u))
+        for stage in invalid:
+            self._values.pop(stage, None)
+        LOGGER.debug(f"Invalidated stages: {', '.join(sorted(invalid)) or '-'}")
+        return invalid
+
+    def results(self):
+        return {"df": self.delta_freq,
+                "eve": np.ones_like(self.delta_freq)*self.rate_eve,
+                "bob": self.rate_bob,
+                "secRate": self.sec_rate,
+               }
@@ -2,17 +2,23 @@ import logging
 
 import numpy as np
 from scipy import constants
-import matplotlib.pyplot as plt
 
 from model import length_los, length_ref
-from two_frequencies import bound_rec_power_two_freq, power_eve
+from two_frequencies import (bound_rec_power_two_freq, power_eve,
+                             delta_freq_peak_approximation)
 from rates import worst_case_rate_eve
-from optimal_frequency_distance import find_optimal_delta_freq
+from optimal_frequency_distance import find_optimal_delta_freq, find_optimal_delta_freq_batch
 from util import export_results, to_decibel, achievable_rate
+from kernels import secrecy_rates
+from disk_cache import disk_cached
+from plotting import LivePlot
+from profiling import (profiled, stage, enable_profiling,
+                       is_profiling_enabled, format_summary, dump_trace)
 
 
 LOGGER = logging.getLogger(__name__)
 
+@disk_cached
 def max_worst_case_sec_rate(d_min_bob: float, d_max_bob: float,
                             d_min_eve: float, freq: float, bw: float,
                             h_tx: float, h_rx_bob: float, h_rx_eve: float,
@@ -28,25 +34,82 @@ def max_worst_case_sec_rate(d_min_bob: float, d_max_bob: float,
     sec_rate_opt_df = np.maximum(rate_bob_opt_df-rate_eve, 0)
     return sec_rate_opt_df
 
+def max_worst_case_sec_rate_batch(d_min_bob, d_max_bob, d_min_eve, freq, bw,
+                                  h_tx, h_rx_bob, h_rx_eve, theta=0.5,
+                                  c=constants.c):
+    rate_eve = worst_case_rate_eve(d_min_eve, freq, bw, h_tx, h_rx_eve)
+    opt_df = find_optimal_delta_freq_batch(d_min_bob, d_max_bob, freq, h_tx,
+                                           h_rx_bob, theta=theta)
+    _power_bob_opt_df = bound_rec_power_two_freq(d_min_bob, d_max_bob, opt_df,
+                                                 freq, h_tx, h_rx_bob,
+                                                 bound="lower", theta=theta)
+    rate_bob_opt_df = achievable_rate(_power_bob_opt_df, bw)
+    sec_rate_opt_df = np.maximum(rate_bob_opt_df-rate_eve, 0)
+    return sec_rate_opt_df
+
+@profiled()
+def max_worst_case_sec_rate_joint(d_min_bob: float, d_max_bob: float,
+                                  d_min_eve: float, freq: float, bw: float,
+                                  h_tx: float, h_rx_bob: float,
+                                  h_rx_eve: float, x0=None,
+                                  theta_bounds=(0., 1.), num_theta: int = 9,
+                                  c=constants.c):
+    # Joint maximization of the worst-case secrecy rate over the frequency
+    # spacing and the power split theta. Eve's bound is power_eve at the same
+    # (df, theta), so that theta has an influence on both rates.
+    # A warm start x0=(df, theta), e.g., the optimum of a neighboring
+    # scenario, is used directly. Without it, the start is the best point on a
+    # theta grid with the optimal df for each theta.
+    from scipy import optimize
+    _df_pi_dmin = delta_freq_peak_approximation(d_min_bob, h_tx, h_rx_bob)[0]
+    _df_2pi_dmax = delta_freq_peak_approximation(d_max_bob, h_tx, h_rx_bob)[1]
+    _bounds = optimize.Bounds([np.log10(_df_pi_dmin), theta_bounds[0]],
+                              [np.log10(_df_2pi_dmax), theta_bounds[1]])
+
+    def func_sec_rate(log_df, theta):
+        _df = 10**log_df
+        power_bob = bound_rec_power_two_freq(d_min_bob, d_max_bob, _df, freq,
+                                             h_tx, h_rx_bob, theta=theta)
+        _power_eve = power_eve(d_min_eve, _df, freq, h_tx, h_rx_eve,
+                               theta=theta)
+        return achievable_rate(power_bob, bw) - achievable_rate(_power_eve, bw)
+
+    if x0 is None:
+        theta = np.linspace(*theta_bounds, num_theta)
+        log_df = np.log10(find_optimal_delta_freq_batch(
+                d_min_bob, d_max_bob, freq, h_tx, h_rx_bob, theta=theta))
+        _start = np.clip(np.stack([log_df, theta], axis=-1), _bounds.lb,
+                         _bounds.ub)
+        _start = _start[np.argmax(func_sec_rate(*_start.T))]
+    else:
+        _start = np.clip([np.log10(x0[0]), x0[1]], _bounds.lb, _bounds.ub)
+    with stage("scipy.optimize.minimize") as _stage:
+        opt = optimize.minimize(lambda x: -func_sec_rate(*x), x0=_start,
+                                method="Nelder-Mead", bounds=_bounds)
+        _stage.add(nfev=opt.nfev, nit=opt.nit)
+    LOGGER.debug(f"Joint optimization finished after {opt.nfev:d} evaluations.")
+    opt_df, opt_theta = 10**opt.x[0], opt.x[1]
+    sec_rate = np.maximum(-opt.fun, 0)
+    return sec_rate, opt_df, opt_theta
+
+def _log_results(results):
+    LOGGER.info(f"Optimal frequency spacing: {results['optDf']:E} Hz")
+    LOGGER.debug(f"Rate Bob at opt. df: {results['rateBobOptDf']:E}")
+    LOGGER.debug(f"Rate Eve at opt. df: {results['rateEveOptDf']:E}")
+    LOGGER.info(f"Secrecy Rate at opt. df: {results['secRateOptDf']:E}")
+
+@disk_cached(on_hit=_log_results)
 def main(d_min_bob: float, d_max_bob: float, d_min_eve: float,
          freq: float, bw: float, h_tx: float, h_rx_bob: float, h_rx_eve: float,
-         theta: float = 0.5, c=constants.c, plot=False, export=False):
+         theta: float = 0.5, c=constants.c, plot=False, export=False,
+         plotter=None):
     num_steps = 2000
     df = np.logspace(7, np.log10(freq), num_steps)
 
-    min_power_bob = bound_rec_power_two_freq(d_min_bob, d_max_bob, df, freq,
-                                             h_tx, h_rx_bob, bound="lower",
-                                             theta=theta)
-    rate_bob = achievable_rate(min_power_bob, bw)
-
-    max_power_eve = power_eve(d_min_eve, df, freq, h_tx, h_rx_eve, theta=theta)
-    max_power_eve_upper = power_eve(d_min_eve, 0, freq, h_tx, h_rx_eve,
-                                    theta=theta)
-    #rate_eve = achievable_rate(max_power_eve, bw)
-    _rate_eve = achievable_rate(max_power_eve_upper, bw)
-    rate_eve = np.ones_like(df) * _rate_eve
-
-    rate_sec = np.maximum(rate_bob-rate_eve, 0)
+    rate_bob, rate_eve, rate_sec = secrecy_rates(d_min_bob, d_max_bob,
+                                                 d_min_eve, df, freq, bw, h_tx,
+                                                 h_rx_bob, h_rx_eve,
+                                                 theta=theta, c=c)
 
     results = {
                "df": df,
@@ -58,32 +121,33 @@ def main(d_min_bob: float, d_max_bob: float, d_min_eve: float,
     LOGGER.info("Determining the optimal frequency spacing...")
     opt_df = find_optimal_delta_freq(d_min_bob, d_max_bob, freq, h_tx, h_rx_bob,
                                      theta=theta)
-    LOGGER.info(f"Optimal frequency spacing: {opt_df:E} Hz")
-    _power_bob_opt_df = bound_rec_power_two_freq(d_min_bob, d_max_bob, opt_df,
-                                                 freq, h_tx, h_rx_bob,
-                                                 bound="lower", theta=theta)
-    rate_bob_opt_df = achievable_rate(_power_bob_opt_df, bw)
-    sec_rate_opt_df = np.maximum(rate_bob_opt_df-_rate_eve, 0)
-    LOGGER.debug(f"Rate Bob at opt. df: {rate_bob_opt_df:E}")
-    LOGGER.debug(f"Rate Eve at opt. df: {_rate_eve:E}")
-    LOGGER.info(f"Secrecy Rate at opt. df: {sec_rate_opt_df:E}")
+    rate_bob_opt_df, rate_eve_opt_df, sec_rate_opt_df = secrecy_rates(
+            d_min_bob, d_max_bob, d_min_eve, opt_df, freq, bw, h_tx, h_rx_bob,
+            h_rx_eve, theta=theta, c=c)
+    _log_results({"optDf": opt_df, "rateBobOptDf": rate_bob_opt_df,
+                  "rateEveOptDf": rate_eve_opt_df,
+                  "secRateOptDf": sec_rate_opt_df})
 
 
     if plot:
-        fig, axs = plt.subplots()
+        if plotter is None:
+            plotter = LivePlot(yscale="log")
         _lim_rate = [1e3, 1e7]
-        axs.set_ylim(_lim_rate)
-        axs.set_xlim([min(df), max(df)])
-        axs.set_xlabel("Delta Freq $\\Delta f$ [Hz]")
-        axs.set_ylabel("Rate $R$ [bit/s]")
-        axs.loglog(df, rate_bob, label="Worst-case Rate Bob")
-        axs.loglog(df, rate_eve, label="Worst-case Rate Eve")
-        axs.loglog(df, rate_sec, label="Secrecy Rate")
+        plotter.axs.set_ylim(_lim_rate)
+        plotter.axs.set_xlim([min(df), max(df)])
+        plotter.axs.set_xlabel("Delta Freq $\\Delta f$ [Hz]")
+        plotter.axs.set_ylabel("Rate $R$ [bit/s]")
+        plotter.update("bob", df, rate_bob, label="Worst-case Rate Bob")
+        plotter.update("eve", df, rate_eve, label="Worst-case Rate Eve")
+        plotter.update("secRate", df, rate_sec, label="Secrecy Rate")
+        plotter.draw()
 
     if export:
         LOGGER.debug("Exporting results.")
         fname = f"sec-rate-{freq:E}-t{h_tx:.1f}-rB{h_rx_bob:.1f}-rE{h_rx_eve:.1f}-dminB{d_min_bob:.1f}-dmaxB{d_max_bob:.1f}-dminE{d_min_eve:.1f}.dat"
         export_results(results, fname)
+    return {**results, "optDf": opt_df, "rateBobOptDf": rate_bob_opt_df,
+            "rateEveOptDf": rate_eve_opt_df, "secRateOptDf": sec_rate_opt_df}
 
 if __name__ == "__main__":
     import argparse
@@ -98,10 +162,13 @@ if __name__ == "__main__":
     parser.add_argument("-e", "--d_min_eve", type=float, default=100.)
     parser.add_argument("--plot", action="store_true")
     parser.add_argument("--export", action="store_true")
+    parser.add_argument("--trace", default=None,
+                        help="Write a Chrome trace (JSON) of the profiled stages to this file")
     parser.add_argument("-v", "--verbosity", action="count", default=0,
                         help="Increase output verbosity")
     args = vars(parser.parse_args())
     verb = args.pop("verbosity")
+    trace = args.pop("trace")
     logging.basicConfig(format="%(asctime)s - %(module)s -- [%(levelname)8s]: %(message)s",
                         handlers=[
                             logging.FileHandler("main.log", encoding="utf-8"),
@@ -109,5 +176,13 @@ if __name__ == "__main__":
                         ])
     loglevel = logging.WARNING - verb*10
     LOGGER.setLevel(loglevel)
+    if verb >= 2 or trace is not None:
+        enable_profiling(trace=trace is not None)
     main(**args)
-    plt.show()
+    if is_profiling_enabled():
+        LOGGER.info(f"Profiling summary:\n{format_summary()}")
+        if trace is not None:
+            dump_trace(trace)
+    if args["plot"]:
+        import matplotlib.pyplot as plt
+        plt.show()
@@ -2,12 +2,14 @@ import logging
 
 import numpy as np
 from scipy import constants
-from scipy import optimize
-import matplotlib.pyplot as plt
 
 from util import export_results, to_decibel
 
-from model import length_los, length_ref
+from cache import scalar_lru_cache
+from model import (lengths, path_difference, path_difference_from_lengths,
+                   distance_from_path_diff)
+from precision import as_compute_dtype, complex_dtype
+from profiling import profiled
 
 
 LOGGER = logging.getLogger(__name__)
@@ -15,54 +17,103 @@ LOGGER = logging.getLogger(__name__)
 
 def delta_phi(distance, freq, h_tx, h_rx, c=constants.speed_of_light):
     omega = 2*np.pi*freq
-    _d_phi = omega/c * (length_ref(distance, h_tx, h_rx)-length_los(distance, h_tx, h_rx))
+    _d_phi = omega/c * path_difference(distance, h_tx, h_rx)
     return _d_phi
 
 def rec_power(distance, freq, h_tx, h_rx, G_los=1, G_ref=1, c=constants.c,
               power_tx=1):
-    d_los = length_los(distance, h_tx, h_rx)
-    d_ref = length_ref(distance, h_tx, h_rx)
+    distance, freq, h_tx, h_rx = as_compute_dtype(distance, freq, h_tx, h_rx)
+    d_los, d_ref = lengths(distance, h_tx, h_rx)
     omega = 2*np.pi*freq
-    phi = omega/c*(d_ref-d_los)
+    _path_diff = path_difference_from_lengths(d_los, d_ref, h_tx, h_rx)
+    phi = omega/c*_path_diff
     _factor = power_tx*(c/(2*omega))**2
-    _part1 = G_los/(d_los**2)
-    _part2 = G_ref/(d_ref**2)
-    _part3 = -2*np.sqrt(G_los*G_ref)/(d_los*d_ref) * np.cos(phi)
-    power_rx = _factor*(_part1+_part2+_part3)
+    # Same as G_los/d_los**2 + G_ref/d_ref**2 - 2*sqrt(G_los*G_ref)*cos(phi)/(d_los*d_ref)
+    # but without the cancellation of the terms at large distances
+    _sqrt_g_los, _sqrt_g_ref = G_los**.5, G_ref**.5
+    _part1 = ((_sqrt_g_los*_path_diff + (_sqrt_g_los-_sqrt_g_ref)*d_los)/(d_los*d_ref))**2
+    _part2 = 4*_sqrt_g_los*_sqrt_g_ref/(d_los*d_ref) * np.sin(phi/2)**2
+    power_rx = _factor*(_part1+_part2)
     return power_rx
 
+def rec_power_grad(distance, freq, h_tx, h_rx, G_los=1, G_ref=1, c=constants.c,
+                   power_tx=1):
+    # rec_power and its derivatives with respect to the distance and the
+    # frequency
+    distance, freq, h_tx, h_rx = as_compute_dtype(distance, freq, h_tx, h_rx)
+    power_rx = rec_power(distance, freq, h_tx, h_rx, G_los=G_los, G_ref=G_ref,
+                         c=c, power_tx=power_tx)
+    d_los, d_ref = lengths(distance, h_tx, h_rx)
+    _path_diff = path_difference_from_lengths(d_los, d_ref, h_tx, h_rx)
+    omega = 2*np.pi*freq
+    phi = omega/c*_path_diff
+    _factor = power_tx*(c/(2*omega))**2
+    _sqrt_g = (G_los*G_ref)**.5
+    _prod = d_los*d_ref
+    _d_path_diff = -distance*_path_diff/_prod
+    grad_distance = _factor*(-2*distance*(G_los/d_los**4 + G_ref/d_ref**4)
+                             + 2*_sqrt_g*np.cos(phi)*distance*(d_los**2+d_ref**2)/_prod**3
+                             + 2*_sqrt_g*np.sin(phi)*omega/c*_d_path_diff/_prod)
+    grad_freq = 2*np.pi*(-2*power_rx/omega
+                         + _factor*2*_sqrt_g*np.sin(phi)*_path_diff/(c*_prod))
+    return power_rx, grad_distance, grad_freq
+
 def rec_power_lower_envelope(distance, freq, h_tx, h_rx, G_los=1, G_ref=1,
                              c=constants.c, power_tx=1):
-    d_los = length_los(distance, h_tx, h_rx)
-    d_ref = length_ref(distance, h_tx, h_rx)
+    distance, freq, h_tx, h_rx = as_compute_dtype(distance, freq, h_tx, h_rx)
+    d_los, d_ref = lengths(distance, h_tx, h_rx)
     omega = 2*np.pi*freq
     _factor = power_tx*(c/(2*omega))**2
-    _part1 = G_los/(d_los**2)
-    _part2 = G_ref/(d_ref**2)
-    _part3 = -2*np.sqrt(G_los*G_ref)/(d_los*d_ref)
-    power_rx = _factor*(_part1+_part2+_part3)
+    # Same as (sqrt(G_los)/d_los - sqrt(G_ref)/d_ref)**2 without cancellation
+    _path_diff = path_difference_from_lengths(d_los, d_ref, h_tx, h_rx)
+    _sqrt_g_los, _sqrt_g_ref = G_los**.5, G_ref**.5
+    power_rx = _factor*((_sqrt_g_los*_path_diff + (_sqrt_g_los-_sqrt_g_ref)*d_los)/(d_los*d_ref))**2
     return power_rx
 
+# The profiler sits inside the cache, i.e., only cache misses are timed
+@scalar_lru_cache()
+@profiled()
 def crit_dist(freq, h_tx, h_rx, c=constants.c, k=None):
+    freq, h_tx, h_rx = as_compute_dtype(freq, h_tx, h_rx)
     a = h_tx - h_rx
     b = h_tx + h_rx
     max_phi = 2*np.pi*freq/c*(b-a)
     max_k = np.divmod(max_phi, 2*np.pi)[0]
     if k is not None:
         if k > max_k: raise ValueError(f"Your provided k is too large. The maximum k is {max_k:d}")
-        k = k + 0j
+        k = np.asarray(k, dtype=complex_dtype())
     else:
-        k = np.arange(max_k)+1 + 0j
+        k = np.arange(1, max_k+1, dtype=complex_dtype())
     _d = -1/(2*c*freq*k)*np.sqrt(c**2*k**2 - 4*freq**2*h_rx**2)*np.sqrt(c**2*k**2 - 4*freq**2*h_tx**2)
     _d = np.real(_d)
     return _d
 
+def crit_dist_index_range(d_min, d_max, freq, h_tx, h_rx, c=constants.c):
+    # Inverse of crit_dist: the path difference at d_k is k*c/freq and it
+    # decreases with the distance. Therefore, all d_k in [d_min, d_max] belong
+    # to k_first <= k <= k_last. The range is empty if k_first > k_last.
+    _diff_dmin = path_difference(d_min, h_tx, h_rx)
+    _diff_dmax = path_difference(d_max, h_tx, h_rx)
+    with np.errstate(invalid="ignore"):
+        k_first = np.maximum(np.ceil(freq*_diff_dmax/c), 1)
+        k_last = np.floor(freq*_diff_dmin/c)
+    return k_first, k_last
+
+@profiled()
+def crit_dist_k(k, freq, h_tx, h_rx, c=constants.c):
+    # Real-valued closed form of crit_dist for given (array of) k
+    with np.errstate(divide="ignore", invalid="ignore"):
+        _d = distance_from_path_diff(k*c/freq, h_tx, h_rx)
+    return _d
+
 def min_rec_power_single_freq(d_min: float, d_max: float, freq,
                               h_tx, h_rx, c=constants.c):
-    _crit_dist = crit_dist(freq, h_tx, h_rx)
-    idx_dk_range = np.where(np.logical_and(_crit_dist>=d_min, _crit_dist<=d_max))
-    dk_worst = np.max(_crit_dist[idx_dk_range])
+    k_first, k_last = crit_dist_index_range(d_min, d_max, freq, h_tx, h_rx, c=c)
+    has_dk = k_first <= k_last
+    dk_worst = np.where(has_dk, crit_dist_k(k_first, freq, h_tx, h_rx, c=c),
+                        d_min)
     _pow_dmin = rec_power(d_min, freq, h_tx, h_rx)
     _pow_dmax = rec_power(d_max, freq, h_tx, h_rx)
     _pow_dk = rec_power(dk_worst, freq, h_tx, h_rx)
-    return np.min([_pow_dmin, _pow_dk, _pow_dmax])
+    power = np.minimum(np.minimum(_pow_dmin, _pow_dk), _pow_dmax)
+    return power[()]
@@ -0,0 +1,123 @@
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from secrecy_rate import max_worst_case_sec_rate_batch
+
+
+LOGGER = logging.getLogger(__name__)
+
+SWEEP_PARAMETERS = ("d_min_bob", "d_max_bob", "d_min_eve", "freq", "bw",
+                    "h_tx", "h_rx_bob", "h_rx_eve")
+
+
+def evaluate_chunk(grid: dict, start: int, stop: int):
+    shape = tuple(len(v) for v in grid.values())
+    idx = np.unravel_index(np.arange(start, stop), shape)
+    params = {k: v[_idx] for (k, v), _idx in zip(grid.items(), idx)}
+    valid = params["d_max_bob"] > params["d_min_bob"]
+    zosc = np.full(stop-start, np.nan)
+    if np.any(valid):
+        zosc[valid] = max_worst_case_sec_rate_batch(
+                **{k: v[valid] for k, v in params.items()})
+    return start, stop, zosc
+
+def _save_checkpoint(filename, grid, zosc, done):
+    _tmp_file = f"{filename}.tmp"
+    with open(_tmp_file, "wb") as _file:
+        np.savez(_file, zosc=zosc, done=done, **grid)
+    os.replace(_tmp_file, filename)
+
+def _load_checkpoint(filename, grid, num_chunks):
+    with np.load(filename) as data:
+        for k, v in grid.items():
+            if not np.array_equal(data[k], v):
+                raise ValueError(f"The checkpoint '{filename}' belongs to a different grid ({k}).")
+        if len(data["done"]) != num_chunks:
+            raise ValueError(f"The checkpoint '{filename}' uses a different chunk size.")
+        return data["zosc"], data["done"]
+
+def sweep_zosc(grid: dict, chunk_size: int = 10000, max_workers=None,
+               checkpoint=None, checkpoint_interval: float = 60.):
+    grid = {k: np.atleast_1d(np.asarray(grid[k], dtype=float))
+            for k in SWEEP_PARAMETERS}
+    shape = tuple(len(v) for v in grid.values())
+    num_points = int(np.prod(shape))
+    chunks = [(start, min(start+chunk_size, num_points))
+              for start in range(0, num_points, chunk_size)]
+
+    if checkpoint is not None and os.path.isfile(checkpoint):
+        zosc, done = _load_checkpoint(checkpoint, grid, len(chunks))
+        LOGGER.info(f"Resuming from checkpoint '{checkpoint}' with {np.count_nonzero(done):d}/{len(chunks):d} chunks done.")
+    else:
+        zosc = np.full(num_points, np.nan)
+        done = np.zeros(len(chunks), dtype=bool)
+
+    LOGGER.info(f"Evaluating {num_points:d} grid points in {len(chunks):d} chunks.")
+    _time_start = time.perf_counter()
+    _time_saved = _time_start
+    _num_done = np.count_nonzero(done)
+    _num_todo = len(chunks) - _num_done
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(evaluate_chunk, grid, start, stop): idx
+                   for idx, (start, stop) in enumerate(chunks) if not done[idx]}
+        for _num_finished, future in enumerate(as_completed(futures), start=1):
+            start, stop, _zosc = future.result()
+            zosc[start:stop] = _zosc
+            done[futures[future]] = True
+            _elapsed = time.perf_counter() - _time_start
+            _eta = _elapsed/_num_finished * (_num_todo-_num_finished)
+            LOGGER.info(f"Chunk {_num_done+_num_finished:d}/{len(chunks):d} done (elapsed: {_elapsed:.1f} s, remaining: {_eta:.1f} s)")
+            if (checkpoint is not None and
+                    time.perf_counter() - _time_saved > checkpoint_interval):
+                _save_checkpoint(checkpoint, grid, zosc, done)
+                _time_saved = time.perf_counter()
+    if checkpoint is not None:
+        _save_checkpoint(checkpoint, grid, zosc, done)
+    return grid, zosc.reshape(shape)
+
+def main(d_min_bob, d_max_bob, d_min_eve, freq, bw, h_tx, h_rx_bob, h_rx_eve,
+         chunk_size=10000, workers=None, checkpoint=None, export=False):
+    grid = {"d_min_bob": d_min_bob, "d_max_bob": d_max_bob,
+            "d_min_eve": d_min_eve, "freq": freq, "bw": bw, "h_tx": h_tx,
+            "h_rx_bob": h_rx_bob, "h_rx_eve": h_rx_eve}
+    grid, zosc = sweep_zosc(grid, chunk_size=chunk_size, max_workers=workers,
+                            checkpoint=checkpoint)
+    LOGGER.info(f"Positive ZOSC for {np.count_nonzero(zosc > 0):d} out of {zosc.size:d} grid points.")
+
+    if export:
+        LOGGER.debug("Exporting results.")
+        np.savez("zosc-sweep.npz", zosc=zosc, **grid)
+    return grid, zosc
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", "--h_tx", type=float, default=[10.], nargs="+")
+    parser.add_argument("-r", "--h_rx_bob", type=float, default=[1.5], nargs="+")
+    parser.add_argument("-re", "--h_rx_eve", type=float, default=[1.5], nargs="+")
+    parser.add_argument("-f", "--freq", type=float, default=[2.4e9], nargs="+")
+    parser.add_argument("-w", "--bw", type=float, default=[100e3], nargs="+")
+    parser.add_argument("-dmin", "--d_min_bob", type=float, default=[20.], nargs="+")
+    parser.add_argument("-dmax", "--d_max_bob", type=float, default=[30.], nargs="+")
+    parser.add_argument("-e", "--d_min_eve", type=float, default=[100.], nargs="+")
+    parser.add_argument("--chunk_size", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--checkpoint", default=None)
+    parser.add_argument("--export", action="store_true")
+    parser.add_argument("-v", "--verbosity", action="count", default=0,
+                        help="Increase output verbosity")
+    args = vars(parser.parse_args())
+    verb = args.pop("verbosity")
+    logging.basicConfig(format="%(asctime)s - %(module)s -- [%(levelname)8s]: %(message)s",
+                        handlers=[
+                            logging.FileHandler("main.log", encoding="utf-8"),
+                            logging.StreamHandler()
+                        ])
+    loglevel = logging.WARNING - verb*10
+    LOGGER.setLevel(loglevel)
+    main(**args)
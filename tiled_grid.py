@@ -0,0 +1,138 @@
+import itertools
+import logging
+import time
+
+import numpy as np
+from scipy import constants
+
+from precision import get_dtype
+from two_frequencies import sum_power, sum_power_envelope
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Receive power of two carriers on a (distance, delta_freq, h_rx) grid
+QUANTITIES = {
+        "power": lambda distance, delta_freq, freq, h_tx, h_rx, theta, c:
+            sum_power(distance, delta_freq, freq, h_tx, h_rx, theta=theta,
+                      c=c),
+        "lower": lambda distance, delta_freq, freq, h_tx, h_rx, theta, c:
+            sum_power_envelope(distance, delta_freq, freq, h_tx, h_rx,
+                               bound="lower", theta=theta, c=c),
+        "upper": lambda distance, delta_freq, freq, h_tx, h_rx, theta, c:
+            sum_power_envelope(distance, delta_freq, freq, h_tx, h_rx,
+                               bound="upper", theta=theta, c=c),
+        }
+
+
+def _grid_axes(distance, delta_freq, h_rx):
+    return [np.atleast_1d(np.asarray(a, dtype=float))
+            for a in (distance, delta_freq, h_rx)]
+
+def iter_power_tiles(distance, delta_freq, freq, h_tx, h_rx, quantity="power",
+                     tile_shape=(4096, 256, 1), theta=0.5, c=constants.c):
+    # Evaluate the grid tile by tile. Each tile is yielded together with its
+    # minimum over the distance axis and the (global) distance index of it.
+    func = QUANTITIES[quantity]
+    axes = _grid_axes(distance, delta_freq, h_rx)
+    shape = tuple(len(a) for a in axes)
+    _starts = [range(0, n, t) for n, t in zip(shape, tile_shape)]
+    for start in itertools.product(*_starts):
+        slices = tuple(slice(s, min(s+t, n))
+                       for s, t, n in zip(start, tile_shape, shape))
+        _distance, _delta_freq, _h_rx = [a[s] for a, s in zip(axes, slices)]
+        power = func(_distance[:, None, None], _delta_freq[None, :, None],
+                     freq, h_tx, _h_rx[None, None, :], theta, c)
+        power = np.broadcast_to(power, tuple(s.stop-s.start for s in slices))
+        _idx = np.argmin(power, axis=0)
+        power_min = np.take_along_axis(power, _idx[None], axis=0)[0]
+        yield slices, power, power_min, _idx + slices[0].start
+
+def evaluate_power_grid(distance, delta_freq, freq, h_tx, h_rx,
+                        quantity="power", filename=None,
+                        tile_shape=(4096, 256, 1), theta=0.5, c=constants.c):
+    # Out-of-core evaluation of the receive power on the grid. The full grid
+    # is only stored if a filename is given, as a memory-mapped .npy file. The
+    # worst case over the distance, i.e., the minimum and the distance where
+    # it occurs, is accumulated from the tiles.
+    axes = _grid_axes(distance, delta_freq, h_rx)
+    shape = tuple(len(a) for a in axes)
+    _is_3d = np.ndim(h_rx) > 0
+    _out_shape = shape if _is_3d else shape[:2]
+    power = None
+    if filename is not None:
+        power = np.lib.format.open_memmap(f"{filename}.npy", mode="w+",
+                                          dtype=get_dtype(), shape=_out_shape)
+    power_min = np.full(shape[1:], np.inf)
+    idx_min = np.zeros(shape[1:], dtype=int)
+
+    num_tiles = int(np.prod([np.ceil(n/t) for n, t in zip(shape, tile_shape)]))
+    _time_start = time.perf_counter()
+    _tiles = iter_power_tiles(*axes[:2], freq, h_tx, axes[2], quantity=quantity,
+                              tile_shape=tile_shape, theta=theta, c=c)
+    for _num_tile, (slices, _power, _min, _idx) in enumerate(_tiles, start=1):
+        if power is not None:
+            power[slices[:len(_out_shape)]] = _power if _is_3d else _power[..., 0]
+        _reduced = power_min[slices[1:]]
+        _is_smaller = _min < _reduced
+        power_min[slices[1:]] = np.where(_is_smaller, _min, _reduced)
+        idx_min[slices[1:]] = np.where(_is_smaller, _idx, idx_min[slices[1:]])
+        LOGGER.debug(f"Tile {_num_tile:d}/{num_tiles:d} done (elapsed: {time.perf_counter()-_time_start:.1f} s)")
+    LOGGER.info(f"Evaluated {int(np.prod(shape)):d} grid points in {num_tiles:d} tiles.")
+    if power is not None:
+        power.flush()
+    d_worst = axes[0][idx_min]
+    if not _is_3d:
+        power_min, d_worst = power_min[..., 0], d_worst[..., 0]
+    return power, power_min, d_worst
+
+
+def main(d_min: float, d_max: float, num_distance: int, df_min: float,
+         df_max: float, num_delta_freq: int, freq: float, h_tx: float, h_rx,
+         quantity="power", tile_distance: int = 4096, tile_delta_freq: int = 256,
+         filename=None, export=False):
+    distance = np.logspace(np.log10(d_min), np.log10(d_max), num_distance)
+    delta_freq = np.logspace(np.log10(df_min), np.log10(df_max), num_delta_freq)
+    h_rx = h_rx[0] if len(h_rx) == 1 else np.array(h_rx)
+    power, power_min, d_worst = evaluate_power_grid(
+            distance, delta_freq, freq, h_tx, h_rx, quantity=quantity,
+            filename=filename, tile_shape=(tile_distance, tile_delta_freq, 1))
+
+    if export:
+        LOGGER.debug("Exporting results.")
+        fname = f"grid-min-{quantity}-{freq:E}-t{h_tx:.1f}-d{d_min:.1f}-{d_max:.1f}.npz"
+        np.savez(fname, delta_freq=delta_freq, h_rx=h_rx, power_min=power_min,
+                 d_worst=d_worst)
+    return power, power_min, d_worst
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-t", "--h_tx", type=float, default=10.)
+    parser.add_argument("-r", "--h_rx", type=float, default=[1.5], nargs="+")
+    parser.add_argument("-f", "--freq", type=float, default=2.4e9)
+    parser.add_argument("-dmin", "--d_min", type=float, default=1.)
+    parser.add_argument("-dmax", "--d_max", type=float, default=1000.)
+    parser.add_argument("-nd", "--num_distance", type=int, default=100000)
+    parser.add_argument("-dfmin", "--df_min", type=float, default=1e7)
+    parser.add_argument("-dfmax", "--df_max", type=float, default=2.4e9)
+    parser.add_argument("-ndf", "--num_delta_freq", type=int, default=1000)
+    parser.add_argument("-q", "--quantity", choices=QUANTITIES, default="power")
+    parser.add_argument("--tile_distance", type=int, default=4096)
+    parser.add_argument("--tile_delta_freq", type=int, default=256)
+    parser.add_argument("-o", "--filename", default=None,
+                        help="Base name of the memory-mapped output of the full grid (.npy)")
+    parser.add_argument("--export", action="store_true")
+    parser.add_argument("-v", "--verbosity", action="count", default=0,
+                        help="Increase output verbosity")
+    args = vars(parser.parse_args())
+    verb = args.pop("verbosity")
+    logging.basicConfig(format="%(asctime)s - %(module)s -- [%(levelname)8s]: %(message)s",
+                        handlers=[
+                            logging.FileHandler("main.log", encoding="utf-8"),
+                            logging.StreamHandler()
+                        ])
+    loglevel = logging.WARNING - verb*10
+    LOGGER.setLevel(loglevel)
+    main(**args)
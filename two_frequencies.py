@@ -2,76 +2,129 @@ import logging
 
 import numpy as np
 from scipy import constants
-from scipy import optimize
-import matplotlib.pyplot as plt
 
 from util import export_results, to_decibel
 
-from model import length_los, length_ref
-from single_frequency import rec_power, crit_dist
+from model import lengths, path_difference, path_difference_from_lengths
+from precision import as_compute_dtype
+from single_frequency import rec_power, crit_dist_index_range, crit_dist_k
+from sampling import adaptive_distances
+from disk_cache import disk_cached
+from plotting import LivePlot
+from profiling import (profiled, enable_profiling, is_profiling_enabled,
+                       format_summary, dump_trace)
 
 
 LOGGER = logging.getLogger(__name__)
 
-@np.vectorize
-def bound_rec_power_two_freq(d_min: float, d_max: float,
-                             delta_freq: float, freq: float,
-                             h_tx: float, h_rx: float, theta: float = 0.5,
-                             c=constants.c,
-                             bound="lower"):
-    _comb_func = np.min if bound == "lower" else np.max
-    _dk_worst_func = np.max if bound == "lower" else np.min
-    #delta_freq = np.abs(freq2 - freq)
-    _crit_dist = crit_dist(delta_freq, h_tx, h_rx)
-    idx_dk_range = np.where(np.logical_and(_crit_dist>=d_min, _crit_dist<=d_max))
-    crit_dist_range = _crit_dist[idx_dk_range]
-    if len(crit_dist_range) > 0:
-        dk_worst = _dk_worst_func(crit_dist_range)
-        _pow_dk = sum_power_envelope(dk_worst, delta_freq, freq, h_tx, h_rx,
-                                     bound=bound, theta=theta)
+@profiled()
+def bound_rec_power_two_freq(d_min, d_max, delta_freq, freq, h_tx, h_rx,
+                             theta=0.5, c=constants.c, bound="lower"):
+    d_min, d_max, delta_freq, freq, h_tx, h_rx, theta = np.broadcast_arrays(
+            *as_compute_dtype(d_min, d_max, delta_freq, freq, h_tx, h_rx, theta))
+    k_first, k_last = crit_dist_index_range(d_min, d_max, delta_freq, h_tx,
+                                            h_rx, c=c)
+    has_dk = k_first <= k_last
+    if bound == "lower":
+        k_worst = k_first
+        _pow_no_dk = np.inf
+        _comb_func = np.minimum
     else:
-        _pow_dk = np.inf if bound == "lower" else np.NINF
+        k_worst = k_last
+        _pow_no_dk = -np.inf
+        _comb_func = np.maximum
+    dk_worst = np.where(has_dk, crit_dist_k(k_worst, delta_freq, h_tx, h_rx, c=c),
+                        d_min)
+    _pow_dk = sum_power_envelope(dk_worst, delta_freq, freq, h_tx, h_rx,
+                                 bound=bound, theta=theta)
+    _pow_dk = np.where(has_dk, _pow_dk, _pow_no_dk)
     _pow_dmin = sum_power_envelope(d_min, delta_freq, freq, h_tx, h_rx,
                                    bound=bound, theta=theta)
     _pow_dmax = sum_power_envelope(d_max, delta_freq, freq, h_tx, h_rx,
                                    bound=bound, theta=theta)
-    return _comb_func([_pow_dmin, _pow_dk, _pow_dmax])
+    power = _comb_func(_comb_func(_pow_dmin, _pow_dk), _pow_dmax)
+    return power[()]
 
 def sum_power_envelope(distance, delta_freq, freq, h_tx, h_rx, bound="lower",
                        theta=0.5, G_los=1, G_ref=1, c=constants.c, power_tx=1):
-    d_los = length_los(distance, h_tx, h_rx)
-    d_ref = length_ref(distance, h_tx, h_rx)
+    distance, delta_freq, freq, h_tx, h_rx, theta = as_compute_dtype(
+            distance, delta_freq, freq, h_tx, h_rx, theta)
+    d_los, d_ref = lengths(distance, h_tx, h_rx)
     freq2 = freq+delta_freq
     omega = 2*np.pi*freq
     omega2 = 2*np.pi*freq2
     delta_omega = omega2-omega
-    _factor = power_tx*(c/2)**2
-    A = theta/omega**2
-    B = (1-theta)/omega2**2
+    # A and B are normalized by omega**2 to avoid underflow in float32
+    _factor = power_tx*(c/(2*omega))**2
+    A = theta
+    B = (1-theta)*(omega/omega2)**2
     _part1 = A + B
     _part2 = 1/d_los**2 + 1/d_ref**2
     #_part1 = c**2/(4*d_los**2) * (1./omega**2 + 1./omega2**2)
     #_part2 = c**2/(4*d_ref**2) * (1./omega**2 + 1./omega2**2)
     #A = (c/(2*omega))**2
     #B = (c/(2*omega2))**2
-    _part3 = 2/(d_los*d_ref) * np.sqrt(A**2 + B**2 + 2*A*B*np.cos(delta_omega/c*(d_ref-d_los)))
+    _path_diff = path_difference_from_lengths(d_los, d_ref, h_tx, h_rx)
+    _phase = delta_omega/c*_path_diff
+    _sqrt_term = np.sqrt(A**2 + B**2 + 2*A*B*np.cos(_phase))
     if bound == "lower":
-        _part3 = -_part3
+        # Same as _part1*_part2 - 2/(d_los*d_ref)*_sqrt_term but without the
+        # cancellation of the terms at large distances
+        _part2 = (_path_diff/(d_los*d_ref))**2
+        _part3 = 2/(d_los*d_ref) * 4*A*B*np.sin(_phase/2)**2/(A+B+_sqrt_term)
+    else:
+        _part3 = 2/(d_los*d_ref) * _sqrt_term
     power_rx = _factor * (_part1 * _part2 + _part3)
     return power_rx
 
+def sum_power_envelope_grad(distance, delta_freq, freq, h_tx, h_rx,
+                            bound="lower", theta=0.5, G_los=1, G_ref=1,
+                            c=constants.c, power_tx=1):
+    # sum_power_envelope and its derivatives with respect to the distance and
+    # delta_freq
+    distance, delta_freq, freq, h_tx, h_rx, theta = as_compute_dtype(
+            distance, delta_freq, freq, h_tx, h_rx, theta)
+    power_rx = sum_power_envelope(distance, delta_freq, freq, h_tx, h_rx,
+                                  bound=bound, theta=theta, c=c,
+                                  power_tx=power_tx)
+    d_los, d_ref = lengths(distance, h_tx, h_rx)
+    _path_diff = path_difference_from_lengths(d_los, d_ref, h_tx, h_rx)
+    omega = 2*np.pi*freq
+    omega2 = 2*np.pi*(freq+delta_freq)
+    delta_omega = omega2-omega
+    _factor = power_tx*(c/(2*omega))**2
+    A = theta
+    B = (1-theta)*(omega/omega2)**2
+    _phase = delta_omega/c*_path_diff
+    _sqrt_term = np.sqrt(A**2 + B**2 + 2*A*B*np.cos(_phase))
+    _sign = -1 if bound == "lower" else 1
+    _prod = d_los*d_ref
+    _d_path_diff = -distance*_path_diff/_prod
+    _d_sqrt_distance = -A*B*np.sin(_phase)*delta_omega/c*_d_path_diff/_sqrt_term
+    grad_distance = _factor*(-2*distance*(A+B)*(1/d_los**4 + 1/d_ref**4)
+                             + _sign*2*(_d_sqrt_distance/_prod
+                                        - _sqrt_term*distance*(d_los**2+d_ref**2)/_prod**3))
+    _d_B = -2*B/omega2
+    _d_sqrt_omega = (B*_d_B + A*_d_B*np.cos(_phase)
+                     - A*B*np.sin(_phase)*_path_diff/c)/_sqrt_term
+    grad_delta_freq = 2*np.pi*_factor*(_d_B*(1/d_los**2 + 1/d_ref**2)
+                                       + _sign*2*_d_sqrt_omega/_prod)
+    return power_rx, grad_distance, grad_delta_freq
+
 def sum_power(distance, delta_freq, freq, h_tx, h_rx, G_los=1, G_ref=1,
-              c=constants.c, power_tx=1):
+              c=constants.c, power_tx=1, theta=0.5):
+    # theta is the fraction of the transmit power on the first carrier
     pow_f1 = rec_power(distance, freq, h_tx, h_rx, G_los=G_los, G_ref=G_ref,
                        c=c, power_tx=power_tx)
     pow_f2 = rec_power(distance, freq+delta_freq, h_tx, h_rx, G_los=G_los,
                        G_ref=G_ref, c=c, power_tx=power_tx)
-    return 0.5*(pow_f1+pow_f2)
+    return theta*pow_f1 + (1-theta)*pow_f2
 
 def power_eve(distance, delta_freq, freq, h_tx, h_rx, theta=.5, G_los=1, G_ref=1,
               c=constants.c, power_tx=1):
-    d_los = length_los(distance, h_tx, h_rx)
-    d_ref = length_ref(distance, h_tx, h_rx)
+    distance, delta_freq, freq, h_tx, h_rx, theta = as_compute_dtype(
+            distance, delta_freq, freq, h_tx, h_rx, theta)
+    d_los, d_ref = lengths(distance, h_tx, h_rx)
     freq2 = freq+delta_freq
     omega = 2*np.pi*freq
     omega2 = 2*np.pi*freq2
@@ -82,19 +135,42 @@ def power_eve(distance, delta_freq, freq, h_tx, h_rx, theta=.5, G_los=1, G_ref=1
     power_rx = power_tx * (_part1 * _part2 * _part3)
     return power_rx
 
+def power_eve_grad(distance, delta_freq, freq, h_tx, h_rx, theta=.5, G_los=1,
+                   G_ref=1, c=constants.c, power_tx=1):
+    # power_eve and its derivatives with respect to the distance and
+    # delta_freq
+    distance, delta_freq, freq, h_tx, h_rx, theta = as_compute_dtype(
+            distance, delta_freq, freq, h_tx, h_rx, theta)
+    d_los, d_ref = lengths(distance, h_tx, h_rx)
+    omega = 2*np.pi*freq
+    omega2 = 2*np.pi*(freq+delta_freq)
+    _factor = power_tx*(c/2)**2
+    _weights = theta/omega**2 + (1-theta)/omega2**2
+    _inv_sum = 1/d_los + 1/d_ref
+    power_rx = _factor*_weights*_inv_sum**2
+    grad_distance = -2*_factor*_weights*_inv_sum*distance*(1/d_los**3 + 1/d_ref**3)
+    grad_delta_freq = -4*np.pi*_factor*(1-theta)/omega2**3*_inv_sum**2
+    return power_rx, grad_distance, grad_delta_freq
+
 def delta_freq_peak_approximation(distance, h_tx, h_rx, c=constants.c):
-    d_los = length_los(distance, h_tx, h_rx)
-    d_ref = length_ref(distance, h_tx, h_rx)
-    a = (d_ref-d_los)/c
-    return np.array([1, 2])/(2*a)
+    a = path_difference(distance, h_tx, h_rx)/c
+    return np.stack([1/(2*a), 2/(2*a)])
 
 
 
 
+@disk_cached
 def main(delta_freq: float, freq: float, h_tx: float, h_rx: float,
-         c=constants.c, plot=False, export=False):
-
-    distance = np.logspace(0, 3, 2000)
+         c=constants.c, plot=False, export=False, adaptive=False,
+         plotter=None):
+
+    if adaptive:
+        distance, _ = adaptive_distances(
+                lambda d: sum_power(d, delta_freq, freq, h_tx, h_rx), 1, 1000,
+                [freq, freq+delta_freq, delta_freq], h_tx, h_rx, c=c)
+        LOGGER.info(f"Adaptive sampling with {len(distance):d} distances.")
+    else:
+        distance = np.logspace(0, 3, 2000)
 
     power_bob = sum_power(distance, delta_freq, freq, h_tx, h_rx)
     power_bob_db = to_decibel(power_bob)
@@ -114,19 +190,21 @@ def main(delta_freq: float, freq: float, h_tx: float, h_rx: float,
               }
 
     if plot:
-        fig, axs = plt.subplots()
-        axs.semilogx(distance, power_bob_db, label="Receive Power")
-        axs.semilogx(distance, power_bob_l_db, label="Lower Bound")
-        axs.semilogx(distance, power_bob_u_db, label="Upper Bound")
-        axs.semilogx(distance, power_eve_db, label="Worst-Case Eve")
-        axs.set_xlabel("Distance $d$ [m]")
-        axs.set_ylabel("Receive Power ${P_s}$ [dB]")
-        axs.legend()
+        if plotter is None:
+            plotter = LivePlot()
+        plotter.update("bob", distance, power_bob_db, label="Receive Power")
+        plotter.update("lower", distance, power_bob_l_db, label="Lower Bound")
+        plotter.update("upper", distance, power_bob_u_db, label="Upper Bound")
+        plotter.update("eve", distance, power_eve_db, label="Worst-Case Eve")
+        plotter.axs.set_xlabel("Distance $d$ [m]")
+        plotter.axs.set_ylabel("Receive Power ${P_s}$ [dB]")
+        plotter.draw(legend=True)
 
     if export:
         LOGGER.debug("Exporting single frequency power results.")
         fname = f"power-{freq:E}-df{delta_freq:E}-t{h_tx:.1f}-r{h_rx:.1f}.dat"
         export_results(results, fname)
+    return results
 
 
 if __name__ == "__main__":
@@ -138,10 +216,15 @@ if __name__ == "__main__":
     parser.add_argument("-df", "--delta_freq", type=float, default=100e6)
     parser.add_argument("--plot", action="store_true")
     parser.add_argument("--export", action="store_true")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Place the distances adaptively around the nulls")
+    parser.add_argument("--trace", default=None,
+                        help="Write a Chrome trace (JSON) of the profiled stages to this file")
     parser.add_argument("-v", "--verbosity", action="count", default=0,
                         help="Increase output verbosity")
     args = vars(parser.parse_args())
     verb = args.pop("verbosity")
+    trace = args.pop("trace")
     logging.basicConfig(format="%(asctime)s - %(module)s -- [%(levelname)8s]: %(message)s",
                         handlers=[
                             logging.FileHandler("main.log", encoding="utf-8"),
@@ -149,5 +232,13 @@ if __name__ == "__main__":
                         ])
     loglevel = logging.WARNING - verb*10
     LOGGER.setLevel(loglevel)
+    if verb >= 2 or trace is not None:
+        enable_profiling(trace=trace is not None)
     main(**args)
-    plt.show()
+    if is_profiling_enabled():
+        LOGGER.info(f"Profiling summary:\n{format_summary()}")
+        if trace is not None:
+            dump_trace(trace)
+    if args["plot"]:
+        import matplotlib.pyplot as plt
+        plt.show()
@@ -1,12 +1,149 @@
+import abc
+import os
+import shutil
+import tempfile
+import zipfile
+
 import numpy as np
-import pandas as pd
+
+from profiling import profiled
 
 def to_decibel(value):
     return 10*np.log10(value)
 
-def export_results(results, filename):
-    df = pd.DataFrame.from_dict(results)
-    df.to_csv(filename, sep='\t', index=False)
+
+class ResultWriter(abc.ABC):
+    def __init__(self, filename, columns):
+        self.filename = filename
+        self.columns = list(columns)
+
+    def _as_columns(self, chunk: dict):
+        return [np.ravel(chunk[k]) for k in self.columns]
+
+    @abc.abstractmethod
+    def write(self, chunk: dict):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+class TsvWriter(ResultWriter):
+    def __init__(self, filename, columns, fmt="%.10g", **kwargs):
+        super().__init__(filename, columns)
+        self._row_fmt = "\t".join([fmt]*len(self.columns)) + "\n"
+        self._file = open(filename, "w", encoding="utf-8")
+        self._file.write("\t".join(self.columns) + "\n")
+
+    def write(self, chunk: dict):
+        data = np.column_stack(self._as_columns(chunk))
+        self._file.write((self._row_fmt*len(data)) % tuple(data.ravel()))
+
+    def close(self):
+        self._file.close()
+
+class NpzWriter(ResultWriter):
+    # The columns of a zip archive can only be written one after the other.
+    # Each column is therefore streamed to a temporary file next to the
+    # output and copied into the archive (as .npy entry) on close.
+    def __init__(self, filename, columns, compressed=False, **kwargs):
+        super().__init__(filename, columns)
+        self.compressed = compressed
+        _dir = os.path.dirname(os.path.abspath(filename))
+        self._files = {k: tempfile.TemporaryFile(dir=_dir) for k in self.columns}
+        self._dtypes = {}
+        self._length = 0
+
+    def write(self, chunk: dict):
+        _columns = self._as_columns(chunk)
+        for k, v in zip(self.columns, _columns):
+            _dtype = self._dtypes.setdefault(k, v.dtype)
+            self._files[k].write(np.ascontiguousarray(v, dtype=_dtype).tobytes())
+        self._length += len(_columns[0])
+
+    def close(self):
+        _compression = zipfile.ZIP_DEFLATED if self.compressed else zipfile.ZIP_STORED
+        try:
+            with zipfile.ZipFile(self.filename, "w", compression=_compression,
+                                 allowZip64=True) as _zip:
+                for k in self.columns:
+                    _dtype = self._dtypes.get(k, np.dtype(float))
+                    _header = {"descr": np.lib.format.dtype_to_descr(_dtype),
+                               "fortran_order": False, "shape": (self._length,)}
+                    with _zip.open(f"{k}.npy", "w", force_zip64=True) as _entry:
+                        np.lib.format.write_array_header_1_0(_entry, _header)
+                        self._files[k].seek(0)
+                        shutil.copyfileobj(self._files[k], _entry)
+        finally:
+            for _file in self._files.values():
+                _file.close()
+
+class NpyWriter(ResultWriter):
+    # Memory-mapped structured array with one field per column
+    def __init__(self, filename, columns, length=None, dtype=float, **kwargs):
+        super().__init__(filename, columns)
+        if length is None:
+            raise ValueError("The total number of rows is required for the npy format.")
+        _dtype = np.dtype([(k, dtype) for k in self.columns])
+        self._data = np.lib.format.open_memmap(filename, mode="w+",
+                                               dtype=_dtype, shape=(length,))
+        self._position = 0
+
+    def write(self, chunk: dict):
+        _columns = self._as_columns(chunk)
+        _stop = self._position + len(_columns[0])
+        for k, v in zip(self.columns, _columns):
+            self._data[k][self._position:_stop] = v
+        self._position = _stop
+
+    def close(self):
+        self._data.flush()
+        _length = len(self._data)
+        del self._data
+        if self._position != _length:
+            raise ValueError(f"Only {self._position:d} out of {_length:d} rows were written to '{self.filename}'.")
+
+class ParquetWriter(ResultWriter):
+    def __init__(self, filename, columns, **kwargs):
+        super().__init__(filename, columns)
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Exporting to parquet requires the pyarrow package.")
+        self._pa = pyarrow
+        self._writer = None
+
+    def write(self, chunk: dict):
+        table = self._pa.table(dict(zip(self.columns, self._as_columns(chunk))))
+        if self._writer is None:
+            self._writer = self._pa.parquet.ParquetWriter(self.filename,
+                                                          table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+WRITERS = {".dat": TsvWriter, ".tsv": TsvWriter, ".txt": TsvWriter,
+           ".npz": NpzWriter, ".npy": NpyWriter, ".parquet": ParquetWriter}
+
+def open_writer(filename, columns, **kwargs):
+    ext = os.path.splitext(filename)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError(f"Unknown export format '{ext}'. Supported are: {', '.join(WRITERS)}")
+    return WRITERS[ext](filename, columns, **kwargs)
+
+@profiled()
+def export_results(results, filename, **kwargs):
+    _length = len(np.ravel(next(iter(results.values()))))
+    with open_writer(filename, results.keys(), length=_length, **kwargs) as writer:
+        writer.write(results)
 
 def achievable_rate(rec_power, bw, noise_den_db=-174):
     #noise_fig = 10**(noise_fig_db/10.)
@@ -0,0 +1,167 @@
+import itertools
+import json
+import logging
+import time
+
+import numpy as np
+
+from two_frequencies import bound_rec_power_two_freq
+from optimal_frequency_distance import find_optimal_delta_freq_batch
+from rates import worst_case_rate_eve
+from secrecy_rate import max_worst_case_sec_rate_batch
+from util import achievable_rate, to_decibel
+
+
+LOGGER = logging.getLogger(__name__)
+
+# The receive power is invariant if all lengths are scaled by s and all
+# frequencies by 1/s. The table therefore uses h_tx=1 and the axes
+#   log10(d_min_bob/h_tx), log10(d_max_bob/d_min_bob), h_rx_bob/h_tx,
+#   log10(freq*h_tx)
+# and stores log10(opt_df*h_tx) and Bob's worst-case power in dB at opt_df.
+# The third value is an estimate of the interpolation error of the power at
+# each node. It is the bound h^2/8*|f"| of linear interpolation with a safety
+# factor of 2, estimated from the second differences along every axis.
+AXES = ("log_d_min", "log_d_ratio", "h_rx_ratio", "log_freq")
+VALUES = ("log_opt_df", "power_bob_db", "error_db")
+
+
+def normalized_coordinates(d_min_bob, d_max_bob, freq, h_tx, h_rx_bob):
+    return (np.log10(d_min_bob/h_tx), np.log10(d_max_bob/d_min_bob),
+            h_rx_bob/h_tx, np.log10(freq*h_tx))
+
+def build_zosc_table(filename: str, log_d_min, log_d_ratio, h_rx_ratio,
+                     log_freq, theta: float = 0.5, chunk_size: int = 10000):
+    axes = [np.asarray(a, dtype=float) for a in (log_d_min, log_d_ratio,
+                                                  h_rx_ratio, log_freq)]
+    if any(np.any(np.diff(a) <= 0) for a in axes):
+        raise ValueError("All table axes need to be strictly increasing.")
+    shape = tuple(len(a) for a in axes)
+    values = np.lib.format.open_memmap(f"{filename}.npy", mode="w+",
+                                       dtype=float, shape=shape+(len(VALUES),))
+    _flat_values = values.reshape(-1, len(VALUES))
+    num_points = _flat_values.shape[0]
+    _time_start = time.perf_counter()
+    for start in range(0, num_points, chunk_size):
+        stop = min(start+chunk_size, num_points)
+        idx = np.unravel_index(np.arange(start, stop), shape)
+        _log_d_min, _log_d_ratio, _h_rx, _log_freq = [a[i] for a, i in zip(axes, idx)]
+        d_min = 10**_log_d_min
+        d_max = d_min*10**_log_d_ratio
+        freq = 10**_log_freq
+        opt_df = find_optimal_delta_freq_batch(d_min, d_max, freq, 1., _h_rx,
+                                               theta=theta)
+        power = bound_rec_power_two_freq(d_min, d_max, opt_df, freq, 1., _h_rx,
+                                         theta=theta)
+        _flat_values[start:stop, 0] = np.log10(opt_df)
+        _flat_values[start:stop, 1] = to_decibel(power)
+        LOGGER.info(f"Table points {stop:d}/{num_points:d} done (elapsed: {time.perf_counter()-_time_start:.1f} s)")
+    _power = values[..., 1]
+    _error = np.zeros(shape)
+    for axis in range(len(shape)):
+        _diff2 = np.abs(np.diff(_power, n=2, axis=axis))/4
+        _diff2 = np.concatenate([np.take(_diff2, [0], axis=axis), _diff2,
+                                 np.take(_diff2, [-1], axis=axis)], axis=axis)
+        _error += _diff2
+    values[..., 2] = np.where(np.isfinite(_error), _error, np.inf)
+    values.flush()
+    meta = {"axes": {k: a.tolist() for k, a in zip(AXES, axes)},
+            "values": VALUES, "theta": theta}
+    with open(f"{filename}.json", "w") as _file:
+        json.dump(meta, _file)
+    return ZoscTable(axes, values, theta=theta)
+
+
+class ZoscTable:
+    def __init__(self, axes, values, theta=0.5):
+        self.axes = [np.asarray(a) for a in axes]
+        self.values = values
+        self.theta = theta
+
+    @classmethod
+    def load(cls, filename: str):
+        with open(f"{filename}.json") as _file:
+            meta = json.load(_file)
+        values = np.load(f"{filename}.npy", mmap_mode="r")
+        return cls([meta["axes"][k] for k in AXES], values, theta=meta["theta"])
+
+    def interpolate(self, d_min_bob, d_max_bob, freq, h_tx, h_rx_bob):
+        # Multilinear interpolation of the table values. The error bound is
+        # the largest curvature estimate at the corners of the cell.
+        coords = np.broadcast_arrays(*normalized_coordinates(
+            d_min_bob, d_max_bob, freq, h_tx, h_rx_bob))
+        inside = np.ones(coords[0].shape, dtype=bool)
+        idx, weights = [], []
+        for axis, x in zip(self.axes, coords):
+            inside &= (x >= axis[0]) & (x <= axis[-1])
+            _idx = np.clip(np.searchsorted(axis, x, side="right")-1, 0,
+                           len(axis)-2)
+            idx.append(_idx)
+            weights.append(np.clip((x-axis[_idx])/(axis[_idx+1]-axis[_idx]), 0, 1))
+        result = np.zeros(inside.shape + (2,))
+        error_db = np.zeros(inside.shape)
+        for corner in itertools.product((0, 1), repeat=len(self.axes)):
+            _weight = np.ones(inside.shape)
+            for _w, _c in zip(weights, corner):
+                _weight *= _w if _c else 1-_w
+            _values = self.values[tuple(i+_c for i, _c in zip(idx, corner))]
+            result += _weight[..., None]*_values[..., :2]
+            error_db = np.maximum(error_db, _values[..., 2])
+        opt_df = 10**result[..., 0]/h_tx
+        power_bob_db = result[..., 1]
+        error_db = np.where(inside, error_db, np.inf)
+        return opt_df, power_bob_db, error_db
+
+    def query(self, d_min_bob, d_max_bob, d_min_eve, freq, bw, h_tx, h_rx_bob,
+              h_rx_eve, tol_db: float = 0.1):
+        # ZOSC from the tabulated worst-case power of Bob. Points outside the
+        # table or with an error bound above tol_db use the exact solver.
+        params = np.broadcast_arrays(d_min_bob, d_max_bob, d_min_eve, freq, bw,
+                                     h_tx, h_rx_bob, h_rx_eve)
+        d_min_bob, d_max_bob, d_min_eve, freq, bw, h_tx, h_rx_bob, h_rx_eve = params
+        opt_df, power_bob_db, error_db = self.interpolate(d_min_bob, d_max_bob,
+                                                          freq, h_tx, h_rx_bob)
+        rate_bob = achievable_rate(10**(power_bob_db/10), bw)
+        rate_eve = worst_case_rate_eve(d_min_eve, freq, bw, h_tx, h_rx_eve)
+        zosc = np.asarray(np.maximum(rate_bob-rate_eve, 0))
+        error_db = np.asarray(error_db)
+        exact = error_db > tol_db
+        if np.any(exact):
+            LOGGER.debug(f"Using the exact solver for {np.count_nonzero(exact):d} out of {exact.size:d} queries.")
+            zosc[exact] = max_worst_case_sec_rate_batch(
+                    *[p[exact] for p in params], theta=self.theta)
+            error_db[exact] = 0
+        return zosc[()], error_db[()]
+
+
+def main(filename: str, num_d_min: int = 25, num_d_ratio: int = 20,
+         num_h_rx: int = 12, num_freq: int = 40, theta: float = 0.5):
+    log_d_min = np.linspace(np.log10(.5), np.log10(50), num_d_min)
+    log_d_ratio = np.linspace(np.log10(1.05), 1, num_d_ratio)
+    h_rx_ratio = np.linspace(.05, 1, num_h_rx)
+    log_freq = np.linspace(9, np.log10(3e12), num_freq)
+    build_zosc_table(filename, log_d_min, log_d_ratio, h_rx_ratio, log_freq,
+                     theta=theta)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument("filename", help="Base name of the table files (.npy and .json)")
+    parser.add_argument("--num_d_min", type=int, default=25)
+    parser.add_argument("--num_d_ratio", type=int, default=20)
+    parser.add_argument("--num_h_rx", type=int, default=12)
+    parser.add_argument("--num_freq", type=int, default=40)
+    parser.add_argument("--theta", type=float, default=0.5)
+    parser.add_argument("-v", "--verbosity", action="count", default=0,
+                        help="Increase output verbosity")
+    args = vars(parser.parse_args())
+    verb = args.pop("verbosity")
+    logging.basicConfig(format="%(asctime)s - %(module)s -- [%(levelname)8s]: %(message)s",
+                        handlers=[
+                            logging.FileHandler("main.log", encoding="utf-8"),
+                            logging.StreamHandler()
+                        ])
+    loglevel = logging.WARNING - verb*10
+    LOGGER.setLevel(loglevel)
+    main(**args)